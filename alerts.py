@@ -0,0 +1,170 @@
+"""
+Server Angel Alerts Module
+Deduplicates and rate-limits error alerts, and reports when they resolve.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from config import Config
+
+
+class AlertManager:
+    """Decides which error alerts are emailed.
+
+    Errors are fingerprinted by context plus their message with volatile
+    parts (hashes, numbers, paths of temp files) masked. A fingerprint seen
+    again within ALERT_DEDUP_WINDOW is only counted. Each context also has a
+    token bucket (ALERT_BURST alerts, refilled one per ALERT_REFILL_INTERVAL
+    seconds) so a flapping failure with changing messages cannot flood the
+    inbox. Suppressed occurrences are summarised in a periodic digest, and a
+    single "resolved" email is sent once a context succeeds again. State is
+    kept in ALERT_STATE_FILE so one-shot runs share it.
+    """
+
+    VOLATILE = [
+        (re.compile(r'\b[0-9a-f]{7,40}\b'), '<hash>'),
+        (re.compile(r'/tmp/\S+'), '<tmp>'),
+        (re.compile(r'\d+(\.\d+)?'), '<n>'),
+    ]
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file or Config.ALERT_STATE_FILE
+
+    @staticmethod
+    def fingerprint(message, context):
+        """Stable identifier for an error regardless of volatile details."""
+        normalized = message.lower()
+        for pattern, replacement in AlertManager.VOLATILE:
+            normalized = pattern.sub(replacement, normalized)
+        return hashlib.sha1(f"{context}\n{normalized}".encode()).hexdigest()[:16]
+
+    @contextmanager
+    def _state(self):
+        """Load, lock and save the alert state around a read-modify-write."""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_file.with_suffix('.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.state_file, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+            state.setdefault('contexts', {})
+            state.setdefault('last_digest', time.time())
+
+            yield state
+
+            tmp_path = self.state_file.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+
+    @staticmethod
+    def _take_token(ctx, now):
+        """Refill the context's bucket and consume one token if available."""
+        tokens = ctx.get('tokens', Config.ALERT_BURST)
+        elapsed = now - ctx.get('refilled', now)
+        tokens = min(Config.ALERT_BURST, tokens + elapsed / Config.ALERT_REFILL_INTERVAL)
+        ctx['refilled'] = now
+        if tokens >= 1:
+            ctx['tokens'] = tokens - 1
+            return True
+        ctx['tokens'] = tokens
+        return False
+
+    def alert(self, error_message, context="general"):
+        """Record an error and email it unless it is a duplicate or rate-limited.
+
+        Returns {'sent': bool, 'reason': 'new' / 'reminder' / 'duplicate' /
+        'rate_limited', 'fingerprint'}.
+        """
+        from mailer import EmailMailer
+
+        now = time.time()
+        fingerprint = AlertManager.fingerprint(error_message, context)
+
+        with self._state() as state:
+            ctx = state['contexts'].setdefault(context, {'active': {}})
+            entry = ctx['active'].get(fingerprint)
+
+            if entry is None:
+                entry = ctx['active'][fingerprint] = {
+                    'message': error_message,
+                    'first_seen': now,
+                    'last_sent': None,
+                    'count': 0,
+                    'suppressed': 0
+                }
+            entry['count'] += 1
+            entry['last_seen'] = now
+            entry['message'] = error_message
+
+            if entry['last_sent'] and now - entry['last_sent'] < Config.ALERT_DEDUP_WINDOW:
+                reason = 'duplicate'
+            elif not AlertManager._take_token(ctx, now):
+                reason = 'rate_limited'
+            else:
+                reason = 'reminder' if entry['last_sent'] else 'new'
+
+            if reason in ('duplicate', 'rate_limited'):
+                entry['suppressed'] += 1
+                logging.info(f"Alert {fingerprint} for {context} suppressed ({reason}, seen {entry['count']}x)")
+                return {'sent': False, 'reason': reason, 'fingerprint': fingerprint}
+
+            entry['last_sent'] = now
+            entry['suppressed'] = 0
+
+        occurrences = None
+        if reason == 'reminder':
+            occurrences = {'count': entry['count'], 'first_seen': entry['first_seen']}
+        EmailMailer.send_error_alert(error_message, context, occurrences)
+        logging.info(f"Error alert sent for {context} ({reason})")
+        return {'sent': True, 'reason': reason, 'fingerprint': fingerprint}
+
+    def resolve(self, context):
+        """Clear a context after a successful run; emails once if it had open alerts."""
+        from mailer import EmailMailer
+
+        with self._state() as state:
+            ctx = state['contexts'].get(context)
+            if not ctx or not ctx.get('active'):
+                return False
+            resolved = list(ctx['active'].values())
+            ctx['active'] = {}
+
+        EmailMailer.send_alert_resolved(context, resolved)
+        logging.info(f"Alerts for {context} resolved ({len(resolved)} distinct errors)")
+        return True
+
+    def send_digest(self, force=False):
+        """Email a summary of suppressed alerts once per ALERT_DIGEST_INTERVAL."""
+        from mailer import EmailMailer
+
+        now = time.time()
+        with self._state() as state:
+            if not force and now - state['last_digest'] < Config.ALERT_DIGEST_INTERVAL:
+                return False
+            state['last_digest'] = now
+
+            pending = []
+            for context, ctx in state['contexts'].items():
+                for entry in ctx.get('active', {}).values():
+                    if entry['suppressed']:
+                        pending.append(dict(entry, context=context))
+                        entry['suppressed'] = 0
+
+        if not pending:
+            return False
+
+        EmailMailer.send_alert_digest(pending)
+        logging.info(f"Alert digest sent ({len(pending)} open alerts)")
+        return True
+
+
+ALERT_MANAGER = AlertManager()
@@ -6,16 +6,25 @@ Standalone server automation agent for health monitoring and deployment.
 
 import argparse
 import logging
+import signal
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
 # Import our modules
 from config import Config
-from health_checks import HealthChecker
+from health_checks import HealthChecker, CPU_SAMPLER
 from git_watcher import GitWatcher
 from deployer import Deployer
-from mailer import EmailMailer
+from mailer import EmailMailer, SMTP_SESSION
+from mail_queue import MAIL_QUEUE
+from alerts import ALERT_MANAGER
+from exporter import DeployStats, MetricsExporter
+from scheduler import Scheduler
+from systemd_units import SystemdUnits
+from metrics_store import METRIC_HISTORY
+from webhook import WebhookListener
 
 
 def setup_logging():
@@ -49,12 +58,20 @@ def validate_configuration():
 def run_health_check(report_type="daily"):
     """Run health check and send report."""
     logging.info(f"Starting {report_type} health check")
+    SystemdUnits.invalidate_discovery()
 
     try:
         # Run health checks
         health_data = HealthChecker.run_full_health_check()
         logging.info("Health check completed")
 
+        if Config.METRICS_HISTORY_ENABLED:
+            try:
+                METRIC_HISTORY.record_health(health_data)
+                health_data['trends'] = METRIC_HISTORY.summary(since=time.time() - 86400)
+            except Exception as e:
+                logging.warning(f"Failed to update metric history: {str(e)}")
+
         # Send email report
         email_result = EmailMailer.send_health_report(health_data, report_type)
 
@@ -70,17 +87,23 @@ def run_health_check(report_type="daily"):
         logging.error(error_msg)
         print(f"❌ {error_msg}")
 
-        # Send error alert
+        # Send error alert (deduplicated and rate limited)
         try:
-            EmailMailer.send_error_alert(error_msg, "health_check")
-            logging.info("Error alert sent")
+            ALERT_MANAGER.alert(error_msg, "health_check")
         except Exception as email_error:
             logging.error(f"Failed to send error alert: {str(email_error)}")
+        return
+
+    try:
+        ALERT_MANAGER.resolve("health_check")
+    except Exception as e:
+        logging.error(f"Failed to update alert state: {str(e)}")
 
 
 def run_git_watch():
     """Run git monitoring and deployment if needed."""
     logging.info("Starting git watch cycle")
+    SystemdUnits.invalidate_discovery()
 
     try:
         # Check for new commits
@@ -93,13 +116,28 @@ def run_git_watch():
             # Run deployment
             deployment_result = Deployer.run_deployment(
                 watch_result['commit_hash'],
-                watch_result.get('requirements_changed', False)
+                watch_result.get('requirements_changed', False),
+                watch_result.get('changed_files'),
+                watch_result.get('previous_commit')
             )
 
             # Update last deployed commit if successful
             if deployment_result.get('success'):
                 GitWatcher.save_last_deployed_commit(watch_result['commit_hash'])
                 logging.info("Last deployed commit updated")
+            elif deployment_result.get('bad_commit'):
+                GitWatcher.mark_bad_commit(watch_result['commit_hash'], deployment_result.get('error', ''))
+                logging.info(f"Marked {watch_result['commit_hash'][:8]} as bad; it will not be retried")
+
+            try:
+                DeployStats.record(deployment_result)
+            except Exception as e:
+                logging.warning(f"Failed to update deploy stats: {str(e)}")
+
+            rollback = deployment_result.get('rollback')
+            if rollback:
+                logging.info(f"Rollback {'succeeded' if rollback.get('success') else 'FAILED'} "
+                             f"in {rollback.get('duration', 0):.2f}s")
 
             # Send deployment report
             email_result = EmailMailer.send_deployment_report(deployment_result)
@@ -122,12 +160,78 @@ def run_git_watch():
         logging.error(error_msg)
         print(f"❌ {error_msg}")
 
-        # Send error alert
+        # Send error alert (deduplicated and rate limited)
         try:
-            EmailMailer.send_error_alert(error_msg, "git_watch")
-            logging.info("Error alert sent")
+            ALERT_MANAGER.alert(error_msg, "git_watch")
         except Exception as email_error:
             logging.error(f"Failed to send error alert: {str(email_error)}")
+        return
+
+    try:
+        ALERT_MANAGER.resolve("git_watch")
+    except Exception as e:
+        logging.error(f"Failed to update alert state: {str(e)}")
+
+
+def record_metrics():
+    """Collect a health sample and append it to the metric history."""
+    METRIC_HISTORY.record_health(HealthChecker.run_full_health_check())
+
+
+def run_daemon():
+    """Run git watch and health reports from a single long-lived process."""
+    scheduler = Scheduler()
+    CPU_SAMPLER.start()
+    if Config.MAIL_QUEUE_ENABLED:
+        MAIL_QUEUE.start()
+
+    scheduler.add_interval_job('git-watch', run_git_watch, Config.GIT_WATCH_INTERVAL)
+    if Config.METRICS_HISTORY_ENABLED:
+        scheduler.add_interval_job('metrics-sample', record_metrics, Config.METRICS_SAMPLE_INTERVAL)
+    scheduler.add_interval_job('alert-digest', ALERT_MANAGER.send_digest, Config.ALERT_DIGEST_INTERVAL,
+                               run_immediately=False)
+    scheduler.add_daily_job('morning-report', lambda: run_health_check('morning'), [Config.MORNING_REPORT])
+    scheduler.add_daily_job('evening-report', lambda: run_health_check('evening'), [Config.EVENING_REPORT])
+
+    listener = None
+    if Config.WEBHOOK_ENABLED:
+        def on_push(payload):
+            logging.info(f"Push received for {payload.get('ref', Config.GIT_BRANCH)}, scheduling git watch")
+            scheduler.trigger('git-watch', Config.WEBHOOK_DEBOUNCE, Config.WEBHOOK_MAX_DELAY)
+
+        try:
+            listener = WebhookListener(on_push)
+            listener.start()
+        except Exception as e:
+            logging.error(f"Failed to start webhook listener, relying on timer: {str(e)}")
+            listener = None
+
+    exporter = None
+    if Config.EXPORTER_ENABLED:
+        try:
+            exporter = MetricsExporter()
+            exporter.start()
+        except Exception as e:
+            logging.error(f"Failed to start metrics exporter: {str(e)}")
+            exporter = None
+
+    def handle_signal(signum, frame):
+        logging.info(f"Received signal {signum}, shutting down daemon")
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    print(f"👼 Server Angel daemon running (git watch every {Config.GIT_WATCH_INTERVAL}s, "
+          f"reports at {Config.MORNING_REPORT} and {Config.EVENING_REPORT})")
+    scheduler.run()
+    if listener:
+        listener.stop()
+    if exporter:
+        exporter.stop()
+    CPU_SAMPLER.stop()
+    MAIL_QUEUE.stop()
+    METRIC_HISTORY.close()
 
 
 def main():
@@ -135,7 +239,7 @@ def main():
     parser = argparse.ArgumentParser(description='Server Angel - Server Automation Agent')
     parser.add_argument(
         '--mode',
-        choices=['health-check', 'git-watch'],
+        choices=['health-check', 'git-watch', 'daemon'],
         required=True,
         help='Operation mode'
     )
@@ -156,10 +260,22 @@ def main():
     validate_configuration()
 
     # Run requested mode
-    if args.mode == 'health-check':
-        run_health_check(args.report_type)
-    elif args.mode == 'git-watch':
-        run_git_watch()
+    try:
+        if args.mode == 'health-check':
+            run_health_check(args.report_type)
+        elif args.mode == 'git-watch':
+            run_git_watch()
+        elif args.mode == 'daemon':
+            run_daemon()
+
+        # One-shot runs send the suppressed-alert digest when it is due
+        if args.mode != 'daemon':
+            ALERT_MANAGER.send_digest()
+    finally:
+        # Deliver whatever was queued (including leftovers from earlier runs)
+        if Config.MAIL_QUEUE_ENABLED:
+            MAIL_QUEUE.flush()
+        SMTP_SESSION.close()
 
     logging.info("Server Angel completed")
 
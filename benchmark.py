@@ -0,0 +1,170 @@
+"""
+Server Angel Benchmark Module
+Short post-deploy latency burst compared against the last good deploy's baseline.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from http_probe import HttpProbe
+
+
+class LatencyBenchmark:
+    """Fires a bounded, concurrent request burst at local endpoints.
+
+    Each worker keeps its own keep-alive connection. The burst stops after
+    BENCHMARK_REQUESTS requests per URL or BENCHMARK_MAX_DURATION seconds,
+    whichever comes first.
+    """
+
+    def __init__(self, urls=None, requests=None, concurrency=None, max_duration=None):
+        if urls is None:
+            urls = Config.split_list(Config.BENCHMARK_URLS or Config.READINESS_URLS)
+        self.urls = list(urls)
+        self.requests = requests or Config.BENCHMARK_REQUESTS
+        self.concurrency = concurrency or Config.BENCHMARK_CONCURRENCY
+        self.max_duration = max_duration or Config.BENCHMARK_MAX_DURATION
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        """Nearest-rank percentile of an already sorted list."""
+        if not sorted_values:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+        return sorted_values[rank - 1]
+
+    def _worker(self, url, count, deadline):
+        """Send up to `count` requests over one connection; returns (latencies, errors)."""
+        probe = HttpProbe(url, timeout=Config.READINESS_REQUEST_TIMEOUT)
+        latencies = []
+        errors = 0
+        try:
+            for _ in range(count):
+                if time.time() >= deadline:
+                    break
+                result = probe.check()
+                if result['ok']:
+                    latencies.append(result['latency'])
+                else:
+                    errors += 1
+        finally:
+            probe.close()
+        return latencies, errors
+
+    def run_url(self, url):
+        """Benchmark one URL and return its latency summary (milliseconds)."""
+        workers = max(1, min(self.concurrency, self.requests))
+        share, extra = divmod(self.requests, workers)
+        started = time.time()
+        deadline = started + self.max_duration
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._worker, url, share + (1 if i < extra else 0), deadline)
+                       for i in range(workers)]
+            results = [f.result() for f in futures]
+        elapsed = time.time() - started
+
+        latencies = sorted(l * 1000 for lat, _ in results for l in lat)
+        errors = sum(e for _, e in results)
+        total = len(latencies) + errors
+
+        def rounded(value):
+            return round(value, 2) if value is not None else None
+
+        return {
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 1.0,
+            'p50': rounded(self.percentile(latencies, 50)),
+            'p95': rounded(self.percentile(latencies, 95)),
+            'p99': rounded(self.percentile(latencies, 99)),
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+            'duration': round(elapsed, 3)
+        }
+
+    def run(self):
+        """Benchmark every URL in turn (so bursts do not skew each other)."""
+        return {url: self.run_url(url) for url in self.urls}
+
+    # ------------------------------------------------------------------
+    # Baseline
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_baseline():
+        """Return the stored baseline {'commit', 'time', 'urls': {...}} or None."""
+        try:
+            with open(Config.BENCHMARK_BASELINE_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def save_baseline(results, commit_hash):
+        """Store results as the baseline for the next deploy."""
+        baseline = {'commit': commit_hash, 'time': time.time(), 'urls': results}
+        Config.BENCHMARK_BASELINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Config.BENCHMARK_BASELINE_FILE.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        os.replace(tmp_path, Config.BENCHMARK_BASELINE_FILE)
+
+    @staticmethod
+    def compare(results, baseline, threshold=None, min_delta=None, error_delta=None):
+        """Compare results with a baseline; returns a list of regression messages.
+
+        A percentile regresses when it is more than `threshold` percent slower
+        than the baseline and by more than `min_delta` milliseconds (so tiny
+        absolute changes on fast endpoints are ignored). The error rate
+        regresses when it is more than `error_delta` percentage points above
+        the baseline, so a single failed request does not fail a deploy.
+        """
+        threshold = Config.BENCHMARK_THRESHOLD if threshold is None else threshold
+        min_delta = Config.BENCHMARK_MIN_DELTA_MS if min_delta is None else min_delta
+        error_delta = Config.BENCHMARK_ERROR_RATE_DELTA if error_delta is None else error_delta
+        regressions = []
+
+        for url, current in results.items():
+            previous = (baseline or {}).get('urls', {}).get(url)
+            if not previous:
+                continue
+
+            if current['error_rate'] - previous.get('error_rate', 0) > error_delta / 100:
+                regressions.append(
+                    f"{url}: error rate {current['error_rate']:.1%} (baseline {previous.get('error_rate', 0):.1%})"
+                )
+
+            for key in ('p50', 'p95', 'p99'):
+                now, before = current.get(key), previous.get(key)
+                if now is None or not before:
+                    continue
+                if now > before * (1 + threshold / 100) and now - before > min_delta:
+                    regressions.append(f"{url}: {key} {now:.1f}ms vs {before:.1f}ms baseline "
+                                       f"(+{(now / before - 1) * 100:.0f}%)")
+
+        return regressions
+
+    @staticmethod
+    def run_gate(commit_hash=None):
+        """Run the benchmark and compare it with the stored baseline."""
+        results = LatencyBenchmark().run()
+        baseline = LatencyBenchmark.load_baseline()
+        regressions = LatencyBenchmark.compare(results, baseline)
+
+        for url, r in results.items():
+            logging.info(f"Benchmark {url}: p50={r['p50']}ms p95={r['p95']}ms p99={r['p99']}ms "
+                         f"{r['throughput']} req/s, {r['errors']} errors")
+        for message in regressions:
+            logging.warning(f"Latency regression: {message}")
+
+        return {
+            'success': not regressions,
+            'results': results,
+            'baseline_commit': (baseline or {}).get('commit'),
+            'baseline': (baseline or {}).get('urls', {}),
+            'regressions': regressions
+        }
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for EmailReporter rendering.
+
+Renders health and deployment reports with many services/steps and reports
+the time per render and the peak memory allocated during one render.
+
+    python benchmarks/reporter_bench.py --services 500
+    # Compare with an older implementation:
+    git show <rev>:reporter.py > /tmp/reporter_old.py
+    python benchmarks/reporter_bench.py --baseline /tmp/reporter_old.py
+"""
+
+import argparse
+import importlib.util
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def load_reporter(path=None):
+    """Import reporter.py from the project, or from `path`."""
+    if path is None:
+        import reporter
+        return reporter.EmailReporter
+    spec = importlib.util.spec_from_file_location('reporter_baseline', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.EmailReporter
+
+
+def sample_data(services, steps):
+    statuses = ['RUNNING', 'RUNNING', 'RUNNING', 'FAILED', 'UNKNOWN']
+    health = {
+        'system': {
+            'cpu_usage': '37.5%', 'load_average': '0.52, 0.61, 0.70',
+            'memory_usage': '64.1%', 'disk_usage': '81.0%', 'uptime': '12 days, 3:04:05'
+        },
+        'services': [
+            {'name': f'worker@{i}.service', 'status': statuses[i % len(statuses)], 'details': 'Active (running)'}
+            for i in range(services)
+        ],
+        'trends': {
+            'samples': 1440,
+            'cpu_percent': {'avg': 30.2, 'max': 91.0},
+            'memory_percent': {'avg': 60.5, 'max': 70.1},
+            'disk_percent': {'avg': 80.9, 'max': 81.0}
+        }
+    }
+    deployment = {
+        'success': False,
+        'commit_hash': '0123456789abcdef0123456789abcdef01234567',
+        'steps': [{'step': f'hook_step_{i}', 'status': 'success', 'duration': 0.25} for i in range(steps)],
+        'time_to_ready': 2.4,
+        'error': 'Deployment verification failed (not ready: gunicorn.service)'
+    }
+    return health, deployment
+
+
+def measure(implementations, func_name, data, number, repeat=7):
+    """Return {impl: (seconds per render, peak bytes)}.
+
+    Timing runs are interleaved between implementations so that CPU
+    frequency changes and other noise affect all of them alike; the best
+    run is kept.
+    """
+    funcs = {impl: getattr(reporter, func_name) for impl, reporter in implementations}
+    for func in funcs.values():
+        func(*data)  # warm-up (builds caches)
+
+    best = {impl: float('inf') for impl in funcs}
+    for _ in range(repeat):
+        for impl, func in funcs.items():
+            seconds = timeit.timeit(lambda: func(*data), number=number) / number
+            best[impl] = min(best[impl], seconds)
+
+    results = {}
+    for impl, func in funcs.items():
+        tracemalloc.start()
+        func(*data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[impl] = (best[impl], peak)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EmailReporter rendering')
+    parser.add_argument('--services', type=int, default=500, help='services in the health report')
+    parser.add_argument('--steps', type=int, default=200, help='steps in the deployment report')
+    parser.add_argument('--number', type=int, default=50, help='renders per timing run')
+    parser.add_argument('--baseline', help='path to another reporter.py to compare against')
+    args = parser.parse_args()
+
+    health, deployment = sample_data(args.services, args.steps)
+    cases = [
+        ('health', 'build_health_report', (health, 'daily')),
+        ('deployment', 'build_deployment_report', (deployment,)),
+    ]
+
+    implementations = [('current', load_reporter())]
+    if args.baseline:
+        implementations.insert(0, ('baseline', load_reporter(args.baseline)))
+
+    print(f"{'report':<12}{'impl':<10}{'ms/render':>12}{'peak KiB':>12}")
+    results = {}
+    for case, func_name, data in cases:
+        for impl, (seconds, peak) in measure(implementations, func_name, data, args.number).items():
+            results[(case, impl)] = (seconds, peak)
+            print(f"{case:<12}{impl:<10}{seconds * 1000:>12.3f}{peak / 1024:>12.1f}")
+
+    if args.baseline:
+        print()
+        for case, _, _ in cases:
+            (base_t, base_m), (cur_t, cur_m) = results[(case, 'baseline')], results[(case, 'current')]
+            print(f"{case}: {base_t / cur_t:.1f}x faster, peak memory {cur_m / base_m:.0%} of baseline")
+
+
+if __name__ == '__main__':
+    main()
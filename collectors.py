@@ -0,0 +1,312 @@
+"""
+Server Angel Collectors Module
+Registry of health collectors that run concurrently, each within its own time budget.
+"""
+
+import logging
+import os
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit, unquote
+import psutil
+from config import Config
+from health_checks import HealthChecker, HEALTH_CACHE
+from http_probe import HttpProbe
+
+
+class Collector:
+    """One named check with a timeout (seconds) and a refresh interval (0 = every run)."""
+
+    def __init__(self, name, func, timeout, interval=0.0):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.interval = interval
+
+
+class CollectorRegistry:
+    """Runs registered collectors in parallel daemon threads.
+
+    A health check waits for each collector at most until its own timeout,
+    so the total time is bounded by the slowest budget rather than the sum
+    of all of them. A collector that overruns is reported as TIMEOUT and
+    left to finish in the background; it is not started again while that
+    run is still in progress, so a hung call (systemctl, a stuck network
+    mount) costs one thread, not one per check. Results younger than a
+    collector's interval are reused, including ones that arrived late.
+    Threads are daemonic so a hung collector never blocks process exit.
+    """
+
+    def __init__(self):
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._running = {}
+        self._last = {}
+
+    def register(self, name, timeout, interval=0.0):
+        """Decorator registering `func()` as collector `name`.
+
+        The function returns a dict with at least 'status' and 'details';
+        any other value becomes an OK result with str(value) as its details
+        and exceptions become ERROR results.
+        """
+        def decorator(func):
+            self._collectors[name] = Collector(name, func, timeout, interval)
+            return func
+        return decorator
+
+    def names(self):
+        return list(self._collectors)
+
+    def budget(self, collector):
+        """Return (timeout, interval) with HEALTH_COLLECTOR_TIMEOUTS/INTERVALS applied."""
+        timeouts = Config.collector_overrides(Config.HEALTH_COLLECTOR_TIMEOUTS)
+        intervals = Config.collector_overrides(Config.HEALTH_COLLECTOR_INTERVALS)
+        return (timeouts.get(collector.name, collector.timeout),
+                intervals.get(collector.name, collector.interval))
+
+    def _execute(self, collector, done, holder):
+        started = time.time()
+        try:
+            data = collector.func()
+            if not isinstance(data, dict):
+                data = {'status': 'OK', 'details': str(data)}
+            result = {'status': data.get('status', 'OK'), 'data': data}
+        except Exception as e:
+            result = {'status': 'ERROR', 'error': f"{collector.name} collector failed: {str(e)}"}
+        result.update({
+            'name': collector.name,
+            'latency': round(time.time() - started, 4),
+            'collected_at': time.time(),
+            'cached': False
+        })
+
+        with self._lock:
+            if result['status'] != 'ERROR':
+                self._last[collector.name] = result
+            self._running.pop(collector.name, None)
+        holder['result'] = result
+        done.set()
+
+    def run(self, names=None):
+        """Run the selected collectors (default: all) and return {name: result}.
+
+        Each result has 'status', 'latency' (seconds), 'cached' and either
+        'data' or 'error'.
+        """
+        selected = [self._collectors[n] for n in (names or self._collectors) if n in self._collectors]
+        started = time.time()
+        results = {}
+        waiting = []
+
+        with self._lock:
+            for collector in selected:
+                timeout, interval = self.budget(collector)
+                last = self._last.get(collector.name)
+                if last and interval > 0 and started - last['collected_at'] < interval:
+                    results[collector.name] = dict(last, cached=True)
+                    continue
+
+                run = self._running.get(collector.name)
+                if run is None:
+                    run = self._running[collector.name] = (started, threading.Event(), {})
+                    threading.Thread(
+                        target=self._execute, args=(collector, run[1], run[2]),
+                        name=f"collector-{collector.name}", daemon=True
+                    ).start()
+                waiting.append((collector.name, run, timeout))
+
+        for name, (run_started, done, holder), timeout in waiting:
+            if done.wait(max(0.0, started + timeout - time.time())):
+                results[name] = holder['result']
+                continue
+
+            if run_started < started:
+                error = f"Previous run still in progress after {time.time() - run_started:.1f}s"
+            else:
+                error = f"No result within {timeout:g}s"
+            logging.warning(f"Health collector {name} timed out: {error}")
+            results[name] = {
+                'name': name,
+                'status': 'TIMEOUT',
+                'error': error,
+                'latency': round(time.time() - run_started, 4),
+                'cached': False
+            }
+
+        return {collector.name: results[collector.name] for collector in selected}
+
+
+# Built-in collectors are registered below; other modules may add their own
+COLLECTORS = CollectorRegistry()
+
+
+def _not_configured(setting):
+    return {'status': 'NOT_CONFIGURED', 'details': f"{setting} not set"}
+
+
+@COLLECTORS.register('system', timeout=5)
+def collect_system():
+    """CPU (rolling sampler), memory, root disk, load and uptime."""
+    return HealthChecker.get_system_health()
+
+
+@COLLECTORS.register('services', timeout=12)
+def collect_services():
+    """Monitored systemd units (one batched systemctl call for stale units)."""
+    return HealthChecker.check_all_services()
+
+
+@COLLECTORS.register('disks', timeout=5, interval=Config.HEALTH_CACHE_DISK_TTL)
+def collect_disks():
+    """Usage of every local partition, or of HEALTH_DISK_PATHS."""
+    paths = Config.split_list(Config.HEALTH_DISK_PATHS)
+    if not paths:
+        partitions = HEALTH_CACHE.get('partitions', Config.HEALTH_CACHE_DISK_TTL, psutil.disk_partitions)
+        seen = set()
+        for partition in partitions:
+            if partition.fstype == 'squashfs' or partition.device in seen:
+                continue
+            seen.add(partition.device)
+            paths.append(partition.mountpoint)
+
+    mounts = []
+    for path in paths:
+        usage = psutil.disk_usage(path)
+        mounts.append({'path': path, 'percent': usage.percent, 'used': usage.used, 'total': usage.total})
+
+    full = [m['path'] for m in mounts if m['percent'] >= 90]
+    return {
+        'status': 'WARNING' if full else 'OK',
+        'details': ', '.join(f"{m['path']} {m['percent']:.1f}%" for m in mounts) or 'No partitions',
+        'mounts': mounts
+    }
+
+
+@COLLECTORS.register('database', timeout=3, interval=30)
+def collect_database():
+    """TCP reachability of the DATABASE_URL server (no driver required)."""
+    if not Config.is_configured(Config.DATABASE_URL):
+        return _not_configured('DATABASE_URL')
+
+    parts = urlsplit(Config.DATABASE_URL)
+    scheme = parts.scheme.split('+')[0]
+    if scheme == 'sqlite':
+        # SQLAlchemy form: sqlite:///app.db is relative (to the application in
+        # PROJECT_ROOT), sqlite:////var/lib/app.db is absolute
+        path = unquote(parts.path)[1:]
+        if not os.path.isabs(path) and Config.is_configured(Config.PROJECT_ROOT):
+            path = os.path.join(Config.PROJECT_ROOT, path)
+        if not os.access(path, os.R_OK):
+            return {'status': 'ERROR', 'details': f"{path} is not readable"}
+        return {'status': 'OK', 'details': f"{path} readable"}
+
+    default_ports = {'postgres': 5432, 'postgresql': 5432, 'mysql': 3306, 'mariadb': 3306}
+    host = parts.hostname or 'localhost'
+    port = parts.port or default_ports.get(scheme)
+    if not port:
+        return {'status': 'ERROR', 'details': f"No port for database scheme '{scheme}'"}
+
+    started = time.time()
+    with socket.create_connection((host, port), timeout=2):
+        latency = time.time() - started
+    return {'status': 'OK', 'details': f"{host}:{port} reachable in {latency * 1000:.1f}ms",
+            'connect_latency': round(latency, 4)}
+
+
+@COLLECTORS.register('redis', timeout=3, interval=30)
+def collect_redis():
+    """Redis PING over REDIS_URL (AUTH and TLS supported, no client library needed)."""
+    if not Config.is_configured(Config.REDIS_URL):
+        return _not_configured('REDIS_URL')
+
+    parts = urlsplit(Config.REDIS_URL)
+    host = parts.hostname or 'localhost'
+    port = parts.port or 6379
+
+    def command(*args):
+        encoded = [a.encode() for a in args]
+        return b''.join([f"*{len(encoded)}\r\n".encode()] +
+                        [f"${len(a)}\r\n".encode() + a + b"\r\n" for a in encoded])
+
+    started = time.time()
+    sock = socket.create_connection((host, port), timeout=2)
+    stream = None
+    try:
+        if parts.scheme == 'rediss':
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        stream = sock.makefile('rb')
+        if parts.password:
+            auth = ('AUTH', unquote(parts.username), unquote(parts.password)) if parts.username \
+                else ('AUTH', unquote(parts.password))
+            sock.sendall(command(*auth))
+            reply = stream.readline().strip()
+            if not reply.startswith(b'+'):
+                return {'status': 'ERROR', 'details': f"AUTH failed: {reply.decode(errors='replace')}"}
+        sock.sendall(command('PING'))
+        reply = stream.readline().strip()
+    finally:
+        if stream:
+            stream.close()
+        sock.close()
+    latency = time.time() - started
+
+    if reply != b'+PONG':
+        return {'status': 'ERROR', 'details': f"Unexpected PING reply: {reply.decode(errors='replace')}"}
+    return {'status': 'OK', 'details': f"{host}:{port} PONG in {latency * 1000:.1f}ms",
+            'ping_latency': round(latency, 4)}
+
+
+@COLLECTORS.register('http', timeout=5)
+def collect_http():
+    """One GET against each READINESS_URLS endpoint."""
+    urls = Config.split_list(Config.READINESS_URLS)
+    if not urls:
+        return _not_configured('READINESS_URLS')
+
+    endpoints = []
+    for url in urls:
+        probe = HttpProbe(url)
+        try:
+            result = probe.check()
+        finally:
+            probe.close()
+        endpoints.append(dict(result, url=url))
+
+    failing = [e['url'] for e in endpoints if not e['ok']]
+    details = f"{len(urls) - len(failing)}/{len(urls)} endpoints OK"
+    if failing:
+        details += f" (failing: {', '.join(failing)})"
+    return {'status': 'ERROR' if failing else 'OK', 'details': details, 'endpoints': endpoints}
+
+
+@COLLECTORS.register('logs', timeout=2, interval=60)
+def collect_logs():
+    """Size of each log file and ERROR/CRITICAL lines in its last 64 KB."""
+    paths = Config.split_list(Config.HEALTH_LOG_FILES) or [str(Config.LOG_FILE)]
+    tail_bytes = 64 * 1024
+
+    files = []
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                f.seek(max(0, size - tail_bytes))
+                tail = f.read()
+        except OSError as e:
+            files.append({'path': path, 'error': e.strerror or str(e)})
+            continue
+        errors = sum(1 for line in tail.splitlines() if b'ERROR' in line or b'CRITICAL' in line)
+        files.append({'path': path, 'size': size, 'recent_errors': errors})
+
+    def describe(entry):
+        name = os.path.basename(entry['path'])
+        if 'error' in entry:
+            return f"{name}: {entry['error']}"
+        return f"{name}: {entry['size'] / 1048576:.1f} MB, {entry['recent_errors']} recent errors"
+
+    warning = any('error' in f or f['recent_errors'] for f in files)
+    return {'status': 'WARNING' if warning else 'OK', 'details': '; '.join(describe(f) for f in files),
+            'files': files}
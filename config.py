@@ -2,8 +2,10 @@
 Server Angel Configuration
 """
 
+import fnmatch
 import os
 from pathlib import Path
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -21,6 +23,34 @@ class Config:
     # Path to the Python Virtual Environment
     VENV_PATH = os.getenv('VENV_PATH', '<ABSOLUTE_PATH_TO_VENV>')
 
+    # ============================
+    # DEPLOY MODE
+    # ============================
+    # 'inplace': git pull inside PROJECT_ROOT and install into VENV_PATH
+    # 'release': build each commit into RELEASES_DIR/<commit> (git worktree +
+    #            its own .venv) and atomically switch the CURRENT_LINK symlink
+    DEPLOY_MODE = os.getenv('DEPLOY_MODE', 'inplace')
+    RELEASES_DIR = Path(os.getenv('RELEASES_DIR', os.path.join(os.path.dirname(PROJECT_ROOT.rstrip('/')), 'releases')))
+    CURRENT_LINK = Path(os.getenv('CURRENT_LINK', os.path.join(os.path.dirname(PROJECT_ROOT.rstrip('/')), 'current')))
+    # Number of release directories kept (the active one is always kept)
+    KEEP_RELEASES = int(os.getenv('KEEP_RELEASES', '3'))
+
+    # Restore the previous release/commit automatically when a deploy fails
+    ROLLBACK_ENABLED = os.getenv('ROLLBACK_ENABLED', 'true').lower() == 'true'
+
+    # JSON list of path-scoped deploy hooks (see hooks.example.json)
+    DEPLOY_HOOKS_FILE = os.getenv('DEPLOY_HOOKS_FILE', str(Path(__file__).parent / 'hooks.json'))
+    # Maximum number of hooks run at the same time
+    HOOK_WORKERS = int(os.getenv('HOOK_WORKERS', '4'))
+
+    # Pre-restart warm-up: compile the new tree to .pyc in parallel and, if
+    # WSGI_MODULE is set (e.g. 'myproject.wsgi:application'), import it in a
+    # separate interpreter; a failure aborts the deploy before any restart.
+    # Off by default: compiling the whole tree adds time to every deploy
+    PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'false').lower() == 'true'
+    WSGI_MODULE = os.getenv('WSGI_MODULE', '')
+    PREWARM_TIMEOUT = int(os.getenv('PREWARM_TIMEOUT', '300'))
+
     # ============================
     # SERVICES TO MONITOR
     # ============================
@@ -31,6 +61,70 @@ class Config:
     REDIS_SERVICE = os.getenv('REDIS_SERVICE', None)
     CELERY_SERVICE = os.getenv('CELERY_SERVICE', None)
 
+    # Extra units to monitor, comma separated; glob patterns such as
+    # 'celery@*' or 'gunicorn-*' are resolved against systemd on each cycle
+    MONITORED_UNITS = os.getenv('MONITORED_UNITS', '')
+    # Units restarted on deploy (names or patterns); defaults to gunicorn + nginx
+    RESTART_UNITS = os.getenv('RESTART_UNITS', '')
+    # How each unit is restarted on deploy, as 'unit_or_pattern=strategy' pairs:
+    #   restart - systemctl restart (default)
+    #   reload  - systemctl reload (e.g. nginx)
+    #   hup     - SIGHUP to the main process: graceful gunicorn worker rotation
+    #   usr2    - gunicorn binary upgrade (USR2, wait for new master, drain old)
+    RESTART_STRATEGIES = os.getenv('RESTART_STRATEGIES', '')
+    # Seconds to wait for a reloaded unit to report ready
+    RELOAD_TIMEOUT = int(os.getenv('RELOAD_TIMEOUT', '60'))
+    # Restart ordering as 'unit=dependency' pairs (patterns allowed), e.g.
+    # 'celery@*=redis,nginx=gunicorn'; units without a path between them
+    # are restarted concurrently
+    RESTART_DEPENDENCIES = os.getenv('RESTART_DEPENDENCIES', '')
+    # Which units a deploy restarts, based on the changed paths, as
+    # 'path_glob=unit[:strategy] ...' rules separated by ';'. An empty unit list
+    # means no restart (e.g. 'docs/**=;*.md='). If any changed file matches no
+    # rule, or requirements.txt changed, the full RESTART_UNITS set is restarted.
+    # Example: 'tasks/**=celery@*;nginx/**=nginx:reload;docs/**='
+    RESTART_PATH_MAP = os.getenv('RESTART_PATH_MAP', '')
+    # Maximum number of units restarted at the same time
+    RESTART_WORKERS = int(os.getenv('RESTART_WORKERS', '4'))
+    # Seconds a resolved unit pattern list is cached
+    UNIT_DISCOVERY_TTL = int(os.getenv('UNIT_DISCOVERY_TTL', '60'))
+
+    # ============================
+    # READINESS GATE
+    # ============================
+    # Local endpoints polled after a restart, comma separated
+    # (e.g. 'http://127.0.0.1:8000/healthz'); restarted units are always polled
+    READINESS_URLS = os.getenv('READINESS_URLS', '')
+    # Seconds allowed for everything to become ready
+    READINESS_TIMEOUT = float(os.getenv('READINESS_TIMEOUT', '60'))
+    # Backoff between attempts starts here and doubles up to READINESS_MAX_DELAY
+    READINESS_INITIAL_DELAY = float(os.getenv('READINESS_INITIAL_DELAY', '0.25'))
+    READINESS_MAX_DELAY = float(os.getenv('READINESS_MAX_DELAY', '5'))
+    # Per-request timeout and accepted status codes ('200' or '200-399')
+    READINESS_REQUEST_TIMEOUT = float(os.getenv('READINESS_REQUEST_TIMEOUT', '2'))
+    READINESS_EXPECT_STATUS = os.getenv('READINESS_EXPECT_STATUS', '200-399')
+
+    # ============================
+    # LATENCY BENCHMARK
+    # ============================
+    # Short request burst after the readiness gate, compared with the baseline
+    # stored by the last successful deploy (including one that only warned)
+    BENCHMARK_ENABLED = os.getenv('BENCHMARK_ENABLED', 'false').lower() == 'true'
+    # Endpoints to benchmark, comma separated (defaults to READINESS_URLS)
+    BENCHMARK_URLS = os.getenv('BENCHMARK_URLS', '')
+    # Requests per URL, concurrent connections, and a hard time limit per URL
+    BENCHMARK_REQUESTS = int(os.getenv('BENCHMARK_REQUESTS', '200'))
+    BENCHMARK_CONCURRENCY = int(os.getenv('BENCHMARK_CONCURRENCY', '8'))
+    BENCHMARK_MAX_DURATION = float(os.getenv('BENCHMARK_MAX_DURATION', '10'))
+    # A percentile regresses when it is THRESHOLD percent and MIN_DELTA_MS slower
+    BENCHMARK_THRESHOLD = float(os.getenv('BENCHMARK_THRESHOLD', '50'))
+    BENCHMARK_MIN_DELTA_MS = float(os.getenv('BENCHMARK_MIN_DELTA_MS', '5'))
+    # Error rate may rise this many percentage points above the baseline
+    BENCHMARK_ERROR_RATE_DELTA = float(os.getenv('BENCHMARK_ERROR_RATE_DELTA', '1'))
+    # 'fail' fails the deploy (and rolls back if ROLLBACK_ENABLED), 'warn' only
+    # reports and accepts the slower numbers as the new baseline
+    BENCHMARK_ACTION = os.getenv('BENCHMARK_ACTION', 'fail')
+
     # ============================
     # EXTERNAL SERVICES
     # ============================
@@ -45,6 +139,33 @@ class Config:
     SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
     SMTP_USER = os.getenv('SMTP_USER', '<YOUR_SMTP_USER>')
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '<YOUR_SMTP_PASSWORD>')
+    # The SMTP connection is reused: probed with NOOP after SMTP_NOOP_INTERVAL
+    # idle seconds and closed after SMTP_MAX_IDLE
+    SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+    SMTP_NOOP_INTERVAL = float(os.getenv('SMTP_NOOP_INTERVAL', '30'))
+    SMTP_MAX_IDLE = float(os.getenv('SMTP_MAX_IDLE', '240'))
+
+    # Outgoing mail is spooled under STATE_DIR and sent by a background worker,
+    # retried with exponential backoff while SMTP is unavailable
+    MAIL_QUEUE_ENABLED = os.getenv('MAIL_QUEUE_ENABLED', 'true').lower() == 'true'
+    MAIL_RETRY_DELAY = float(os.getenv('MAIL_RETRY_DELAY', '30'))
+    MAIL_RETRY_MAX_DELAY = float(os.getenv('MAIL_RETRY_MAX_DELAY', '1800'))
+    # Undelivered messages older than this move to mail_spool/failed
+    MAIL_MAX_AGE = int(os.getenv('MAIL_MAX_AGE', str(3 * 86400)))
+    # Seconds a one-shot run spends delivering the spool before exiting
+    MAIL_FLUSH_TIMEOUT = float(os.getenv('MAIL_FLUSH_TIMEOUT', '60'))
+
+    # ============================
+    # ERROR ALERTS
+    # ============================
+    # The same error is emailed at most once per ALERT_DEDUP_WINDOW seconds
+    ALERT_DEDUP_WINDOW = int(os.getenv('ALERT_DEDUP_WINDOW', '3600'))
+    # Per-context token bucket: up to ALERT_BURST alerts at once, refilled by
+    # one every ALERT_REFILL_INTERVAL seconds
+    ALERT_BURST = int(os.getenv('ALERT_BURST', '3'))
+    ALERT_REFILL_INTERVAL = int(os.getenv('ALERT_REFILL_INTERVAL', '1200'))
+    # Seconds between digests summarising suppressed alerts
+    ALERT_DIGEST_INTERVAL = int(os.getenv('ALERT_DIGEST_INTERVAL', '21600'))
     
     # Email Headers
     EMAIL_FROM = os.getenv('EMAIL_FROM', 'server-angel@example.com')
@@ -63,6 +184,68 @@ class Config:
     MORNING_REPORT = os.getenv('MORNING_REPORT', '08:00')
     EVENING_REPORT = os.getenv('EVENING_REPORT', '20:00')
 
+    # ============================
+    # DAEMON MODE
+    # ============================
+    # Seconds between git watch cycles when running with --mode=daemon
+    GIT_WATCH_INTERVAL = int(os.getenv('GIT_WATCH_INTERVAL', '300'))
+
+    # ============================
+    # PUSH WEBHOOK (daemon mode)
+    # ============================
+    # Local listener that runs a git watch cycle as soon as a push arrives;
+    # the GIT_WATCH_INTERVAL timer stays active as a fallback
+    WEBHOOK_ENABLED = os.getenv('WEBHOOK_ENABLED', 'false').lower() == 'true'
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '9000'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    # Shared secret used to verify X-Hub-Signature-256 / X-Gitlab-Token
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    # Wait this many quiet seconds after a push before deploying, but never
+    # more than WEBHOOK_MAX_DELAY after the first push in a burst
+    WEBHOOK_DEBOUNCE = float(os.getenv('WEBHOOK_DEBOUNCE', '10'))
+    WEBHOOK_MAX_DELAY = float(os.getenv('WEBHOOK_MAX_DELAY', '60'))
+
+    # ============================
+    # HEALTH CACHE
+    # ============================
+    # Seconds a measurement is reused by reports, deploy verification and the
+    # exporter (CPU always comes from the rolling sampler); 0 disables caching
+    HEALTH_CACHE_SERVICES_TTL = float(os.getenv('HEALTH_CACHE_SERVICES_TTL', '5'))
+    HEALTH_CACHE_MEMORY_TTL = float(os.getenv('HEALTH_CACHE_MEMORY_TTL', '5'))
+    HEALTH_CACHE_DISK_TTL = float(os.getenv('HEALTH_CACHE_DISK_TTL', '60'))
+
+    # ============================
+    # HEALTH COLLECTORS
+    # ============================
+    # Collectors run concurrently; each has its own timeout so one hung check
+    # (systemctl, a stuck network mount) cannot delay the others
+    HEALTH_COLLECTORS = os.getenv('HEALTH_COLLECTORS', 'system,services,disks,database,redis,http,logs')
+    # Per-collector overrides, e.g. "disks=10,database=2" (seconds)
+    HEALTH_COLLECTOR_TIMEOUTS = os.getenv('HEALTH_COLLECTOR_TIMEOUTS', '')
+    HEALTH_COLLECTOR_INTERVALS = os.getenv('HEALTH_COLLECTOR_INTERVALS', '')
+    # Mount points checked by the disks collector (default: all local partitions)
+    HEALTH_DISK_PATHS = os.getenv('HEALTH_DISK_PATHS', '')
+    # Log files checked by the logs collector (default: Server Angel's own log)
+    HEALTH_LOG_FILES = os.getenv('HEALTH_LOG_FILES', '')
+
+    # ============================
+    # METRICS EXPORTER (daemon mode)
+    # ============================
+    # Prometheus/OpenMetrics endpoint at http://EXPORTER_HOST:EXPORTER_PORT/metrics,
+    # served from a snapshot refreshed every EXPORTER_REFRESH_INTERVAL seconds
+    EXPORTER_ENABLED = os.getenv('EXPORTER_ENABLED', 'false').lower() == 'true'
+    EXPORTER_HOST = os.getenv('EXPORTER_HOST', '127.0.0.1')
+    EXPORTER_PORT = int(os.getenv('EXPORTER_PORT', '9101'))
+    EXPORTER_REFRESH_INTERVAL = float(os.getenv('EXPORTER_REFRESH_INTERVAL', '15'))
+
+    # ============================
+    # CPU SAMPLING
+    # ============================
+    # Seconds between background CPU samples and length of the rolling window
+    CPU_SAMPLE_INTERVAL = float(os.getenv('CPU_SAMPLE_INTERVAL', '1.0'))
+    CPU_SAMPLE_WINDOW = int(os.getenv('CPU_SAMPLE_WINDOW', '60'))
+
     # ============================
     # SERVER ANGEL PATHS
     # ============================
@@ -70,8 +253,137 @@ class Config:
     STATE_DIR = ANGEL_ROOT / 'state'
     LOG_DIR = ANGEL_ROOT / 'logs'
     LAST_COMMIT_FILE = STATE_DIR / 'last_commit.txt'
+    # Commits whose deployment failed; not retried until a newer commit arrives
+    BAD_COMMITS_FILE = STATE_DIR / 'bad_commits.json'
+    BENCHMARK_BASELINE_FILE = STATE_DIR / 'benchmark_baseline.json'
+    MAIL_SPOOL_DIR = STATE_DIR / 'mail_spool'
+    ALERT_STATE_FILE = STATE_DIR / 'alerts.json'
+    DEPLOY_STATS_FILE = STATE_DIR / 'deploy_stats.json'
     LOG_FILE = LOG_DIR / 'angel.log'
 
+    # ============================
+    # DEPENDENCY CACHE
+    # ============================
+    # Wheels are built once per requirements.txt hash + Python version and
+    # installed offline with --no-index --find-links
+    WHEELHOUSE_ENABLED = os.getenv('WHEELHOUSE_ENABLED', 'true').lower() == 'true'
+    WHEELHOUSE_DIR = Path(os.getenv('WHEELHOUSE_DIR', str(STATE_DIR / 'wheelhouse')))
+    # Number of wheelhouses (requirement sets) kept on disk
+    WHEELHOUSE_KEEP = int(os.getenv('WHEELHOUSE_KEEP', '5'))
+
+    # ============================
+    # METRIC HISTORY
+    # ============================
+    # Raw health samples kept in a fixed-size ring buffer under STATE_DIR
+    METRICS_HISTORY_ENABLED = os.getenv('METRICS_HISTORY_ENABLED', 'true').lower() == 'true'
+    METRICS_HISTORY_FILE = STATE_DIR / 'metrics.ring'
+    # Number of samples kept (default: one week at one sample per minute)
+    METRICS_HISTORY_CAPACITY = int(os.getenv('METRICS_HISTORY_CAPACITY', '10080'))
+    # Seconds between samples recorded by daemon mode
+    METRICS_SAMPLE_INTERVAL = int(os.getenv('METRICS_SAMPLE_INTERVAL', '60'))
+
+    @staticmethod
+    def split_list(value):
+        """Split a comma separated setting into a list of non-empty items."""
+        return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+    @classmethod
+    def is_configured(cls, value):
+        """Return True if a setting is set and not a '<placeholder>'."""
+        return bool(value) and not value.startswith('<')
+
+    @staticmethod
+    def path_matches(path, pattern):
+        """fnmatch a repository path against a glob where `**/` also matches zero directories.
+
+        `*` already crosses `/` in fnmatch, so `**` behaves like `*`; the only
+        difference is that `**/migrations/**` must match `migrations/0002.py`.
+        """
+        variants, pending = {pattern}, [pattern]
+        while pending:
+            current = pending.pop()
+            start = current.find('**/')
+            while start != -1:
+                shorter = current[:start] + current[start + 3:]
+                if shorter not in variants:
+                    variants.add(shorter)
+                    pending.append(shorter)
+                start = current.find('**/', start + 1)
+        return any(fnmatch.fnmatch(path, v.replace('**', '*')) for v in variants)
+
+    @classmethod
+    def monitored_unit_patterns(cls):
+        """Units and unit patterns watched by the health checker."""
+        legacy = [cls.NGINX_SERVICE, cls.GUNICORN_SERVICE, cls.REDIS_SERVICE, cls.CELERY_SERVICE]
+        return [u for u in legacy if cls.is_configured(u)] + cls.split_list(cls.MONITORED_UNITS)
+
+    @classmethod
+    def restart_unit_patterns(cls):
+        """Units and unit patterns restarted after a deployment."""
+        patterns = cls.split_list(cls.RESTART_UNITS)
+        if patterns:
+            return patterns
+        return [u for u in [cls.GUNICORN_SERVICE, cls.NGINX_SERVICE] if cls.is_configured(u)]
+
+    @classmethod
+    def restart_strategy(cls, unit):
+        """Return the restart strategy configured for a unit (first matching pattern wins)."""
+        for item in cls.split_list(cls.RESTART_STRATEGIES):
+            pattern, _, strategy = item.partition('=')
+            pattern = pattern.strip()
+            if fnmatch.fnmatch(unit, pattern) or fnmatch.fnmatch(unit, f"{pattern}.service"):
+                return strategy.strip().lower() or 'restart'
+        return 'restart'
+
+    @classmethod
+    def restart_dependencies(cls, units):
+        """Map each unit to the units (from the same list) it must be restarted after."""
+        def matches(unit, pattern):
+            return fnmatch.fnmatch(unit, pattern) or fnmatch.fnmatch(unit, f"{pattern}.service")
+
+        rules = []
+        for item in cls.split_list(cls.RESTART_DEPENDENCIES):
+            unit_pattern, _, dep_pattern = item.partition('=')
+            if unit_pattern.strip() and dep_pattern.strip():
+                rules.append((unit_pattern.strip(), dep_pattern.strip()))
+
+        return {
+            unit: [dep for dep in units if dep != unit and any(
+                matches(unit, u) and matches(dep, d) for u, d in rules
+            )]
+            for unit in units
+        }
+
+    @classmethod
+    def restart_path_rules(cls):
+        """Parse RESTART_PATH_MAP into [(path_glob, [(unit_pattern, strategy or None)])]."""
+        rules = []
+        for item in (cls.RESTART_PATH_MAP or '').split(';'):
+            if not item.strip():
+                continue
+            path_glob, _, units = item.partition('=')
+            targets = []
+            for unit in units.split():
+                name, _, strategy = unit.partition(':')
+                targets.append((name, strategy.lower() or None))
+            rules.append((path_glob.strip(), targets))
+        return rules
+
+    @classmethod
+    def collector_overrides(cls, setting):
+        """Parse a "name=seconds" list such as HEALTH_COLLECTOR_TIMEOUTS into a dict."""
+        overrides = {}
+        for item in cls.split_list(setting):
+            name, _, value = item.partition('=')
+            overrides[name.strip()] = float(value)
+        return overrides
+
+    @classmethod
+    def readiness_status_range(cls):
+        """Parse READINESS_EXPECT_STATUS into an inclusive (low, high) tuple."""
+        low, _, high = cls.READINESS_EXPECT_STATUS.partition('-')
+        return int(low), int(high or low)
+
     @classmethod
     def validate(cls):
         """Validate that required configuration is set."""
@@ -86,6 +398,45 @@ class Config:
             if isinstance(value, str) and value.startswith('<') and value.endswith('>'):
                 missing.append(attr)
 
+        for item in cls.split_list(cls.RESTART_STRATEGIES):
+            strategy = item.partition('=')[2].strip().lower()
+            if strategy not in ('restart', 'reload', 'hup', 'usr2'):
+                raise ValueError(f"Unknown restart strategy in RESTART_STRATEGIES: '{item}'")
+
+        if cls.DEPLOY_MODE not in ('inplace', 'release'):
+            raise ValueError(f"DEPLOY_MODE must be 'inplace' or 'release', got '{cls.DEPLOY_MODE}'")
+
+        if cls.BENCHMARK_ACTION not in ('fail', 'warn'):
+            raise ValueError(f"BENCHMARK_ACTION must be 'fail' or 'warn', got '{cls.BENCHMARK_ACTION}'")
+
+        try:
+            cls.readiness_status_range()
+        except ValueError:
+            raise ValueError(f"READINESS_EXPECT_STATUS must look like '200' or '200-399', "
+                             f"got '{cls.READINESS_EXPECT_STATUS}'")
+
+        for setting in ('READINESS_URLS', 'BENCHMARK_URLS'):
+            for url in cls.split_list(getattr(cls, setting)):
+                try:
+                    parts = urlsplit(url)
+                    valid = parts.scheme in ('http', 'https') and bool(parts.hostname)
+                    parts.port  # raises ValueError for a non-numeric or out-of-range port
+                except ValueError:
+                    valid = False
+                if not valid:
+                    raise ValueError(f"{setting} entries must be http(s) URLs with a host, got '{url}'")
+
+        for setting in ('CPU_SAMPLE_INTERVAL', 'CPU_SAMPLE_WINDOW'):
+            if getattr(cls, setting) <= 0:
+                raise ValueError(f"{setting} must be a positive number, got {getattr(cls, setting)}")
+
+        for setting in ('HEALTH_COLLECTOR_TIMEOUTS', 'HEALTH_COLLECTOR_INTERVALS'):
+            try:
+                cls.collector_overrides(getattr(cls, setting))
+            except ValueError:
+                raise ValueError(f"{setting} must look like 'disks=10,database=2', "
+                                 f"got '{getattr(cls, setting)}'")
+
         if missing:
             raise ValueError(
                 f"Required configuration not set: {', '.join(missing)}.\n"
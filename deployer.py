@@ -4,10 +4,23 @@ Handles safe deployment: git pull, dependency updates, and service restarts.
 """
 
 import subprocess
+import fnmatch
+import hashlib
 import os
+import platform
+import shutil
+import tempfile
 import time
 import logging
+import psutil
+from pathlib import Path
 from config import Config
+from systemd_units import SystemdUnits
+from health_checks import HEALTH_CACHE
+from taskgraph import TaskGraph
+from hooks import DeployHooks
+from http_probe import ReadinessGate
+from benchmark import LatencyBenchmark
 
 
 class Deployer:
@@ -21,11 +34,11 @@ class Deployer:
 
         for attempt in range(max_retries):
             try:
-                os.chdir(Config.PROJECT_ROOT)
                 logging.info(f"Pulling changes (attempt {attempt + 1}/{max_retries})")
 
                 result = subprocess.run(
                     ['git', 'pull', Config.GIT_REMOTE, Config.GIT_BRANCH],
+                    cwd=Config.PROJECT_ROOT,
                     capture_output=True,
                     text=True,
                     timeout=120
@@ -60,121 +73,633 @@ class Deployer:
                 else:
                     raise Exception(f"Failed to pull changes: {str(e)}")
 
+    # File inside the venv recording which requirements set is installed
+    REQUIREMENTS_MARKER = '.server-angel-requirements'
+
+    @staticmethod
+    def _venv_python_version(venv_path):
+        """Read the venv's Python version from pyvenv.cfg (falls back to asking the interpreter)."""
+        cfg = Path(venv_path) / 'pyvenv.cfg'
+        try:
+            with open(cfg, 'r') as f:
+                for line in f:
+                    key, _, value = line.partition('=')
+                    if key.strip() in ('version', 'version_info'):
+                        return value.strip()
+        except OSError:
+            pass
+
+        result = subprocess.run(
+            [str(Path(venv_path) / 'bin' / 'python'), '-c', 'import sys; print(sys.version.split()[0])'],
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+        return result.stdout.strip()
+
+    @staticmethod
+    def requirements_key(project_root=None, venv_path=None):
+        """Hash of requirements.txt plus the venv Python version and machine type."""
+        project_root = Path(project_root or Config.PROJECT_ROOT)
+        venv_path = venv_path or Config.VENV_PATH
+
+        digest = hashlib.sha256()
+        with open(project_root / 'requirements.txt', 'rb') as f:
+            digest.update(f.read())
+        digest.update(Deployer._venv_python_version(venv_path).encode())
+        digest.update(platform.machine().encode())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _build_wheelhouse(python, requirements, key):
+        """Build (once) a wheelhouse for this requirements key and return its path."""
+        wheel_dir = Config.WHEELHOUSE_DIR / key
+        if (wheel_dir / '.complete').exists():
+            logging.info(f"Using cached wheelhouse {key}")
+            return wheel_dir
+
+        Config.WHEELHOUSE_DIR.mkdir(parents=True, exist_ok=True)
+        build_dir = Path(tempfile.mkdtemp(prefix=f'{key}-', dir=Config.WHEELHOUSE_DIR))
+        logging.info(f"Building wheelhouse {key}")
+
+        try:
+            result = subprocess.run(
+                [python, '-m', 'pip', 'wheel', '-q', '-r', str(requirements), '-w', str(build_dir)],
+                capture_output=True,
+                text=True,
+                timeout=600
+            )
+            if result.returncode != 0:
+                raise Exception(f"pip wheel failed: {result.stderr.strip()[-500:]}")
+
+            (build_dir / '.complete').touch()
+            if wheel_dir.exists():
+                shutil.rmtree(wheel_dir)
+            os.rename(build_dir, wheel_dir)
+        finally:
+            if build_dir.exists():
+                shutil.rmtree(build_dir, ignore_errors=True)
+
+        Deployer._prune_wheelhouses()
+        return wheel_dir
+
     @staticmethod
-    def update_dependencies():
-        """Update Python dependencies if requirements.txt changed."""
+    def _prune_wheelhouses():
+        """Keep only the most recently used WHEELHOUSE_KEEP wheelhouses."""
         try:
-            os.chdir(Config.PROJECT_ROOT)
+            houses = sorted(
+                (d for d in Config.WHEELHOUSE_DIR.iterdir() if (d / '.complete').exists()),
+                key=lambda d: (d / '.complete').stat().st_mtime,
+                reverse=True
+            )
+            for old in houses[Config.WHEELHOUSE_KEEP:]:
+                shutil.rmtree(old, ignore_errors=True)
+        except OSError as e:
+            logging.warning(f"Failed to prune wheelhouses: {str(e)}")
 
-            # Activate virtual environment
-            activate_cmd = f"source {Config.VENV_PATH}/bin/activate && pip install -r requirements.txt"
+    @staticmethod
+    def update_dependencies(project_root=None, venv_path=None):
+        """Install requirements.txt into the venv, reusing cached wheels.
+
+        Skips the install entirely when the venv already has this exact
+        requirements set, and otherwise installs offline from a wheelhouse
+        keyed by the requirements hash, falling back to a normal online
+        install if the wheelhouse cannot be built.
+        """
+        project_root = Path(project_root or Config.PROJECT_ROOT)
+        venv_path = Path(venv_path or Config.VENV_PATH)
+        requirements = project_root / 'requirements.txt'
+        python = str(venv_path / 'bin' / 'python')
+        marker = venv_path / Deployer.REQUIREMENTS_MARKER
 
+        try:
+            if not requirements.exists():
+                return {'success': True, 'skipped': True, 'output': 'No requirements.txt found'}
+
+            key = Deployer.requirements_key(project_root, venv_path)
+            if marker.exists() and marker.read_text().strip() == key:
+                logging.info(f"Requirements set {key} already installed, skipping pip")
+                return {'success': True, 'skipped': True, 'requirements_key': key,
+                        'output': 'Installed packages already match requirements.txt'}
+
+            install_cmd = [python, '-m', 'pip', 'install', '-q', '-r', str(requirements)]
+            source = 'index'
+            if Config.WHEELHOUSE_ENABLED:
+                try:
+                    wheel_dir = Deployer._build_wheelhouse(python, requirements, key)
+                    (wheel_dir / '.complete').touch()  # mark as recently used
+                    install_cmd += ['--no-index', '--find-links', str(wheel_dir)]
+                    source = 'wheelhouse'
+                except Exception as e:
+                    logging.warning(f"Wheelhouse unavailable, installing from index: {str(e)}")
+
+            # A failed install may leave the venv half-upgraded; it must not look like any known set
+            marker.unlink(missing_ok=True)
             result = subprocess.run(
-                ['bash', '-c', activate_cmd],
+                install_cmd,
+                cwd=str(project_root),
                 capture_output=True,
                 text=True,
                 timeout=300  # 5 minutes timeout
             )
 
             if result.returncode == 0:
-                return {'success': True, 'output': result.stdout.strip()}
+                marker.write_text(key)
+                return {'success': True, 'requirements_key': key, 'source': source,
+                        'output': result.stdout.strip()}
             else:
                 raise Exception(f"Dependency update failed: {result.stderr}")
 
         except Exception as e:
             raise Exception(f"Failed to update dependencies: {str(e)}")
 
+    # ==========================
+    # WARM-UP
+    # ==========================
+    IMPORT_CHECK_SCRIPT = (
+        "import importlib, sys\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "module, _, attr = sys.argv[2].partition(':')\n"
+        "app = importlib.import_module(module)\n"
+        "if attr and not callable(getattr(app, attr)):\n"
+        "    raise SystemExit(f'{sys.argv[2]} is not callable')\n"
+    )
+
     @staticmethod
-    def restart_service(service_name):
-        """Restart a systemd service."""
+    def prewarm(workdir=None, venv_path=None):
+        """Compile the tree to bytecode in parallel and smoke-test the WSGI import."""
+        workdir = Path(workdir or Config.PROJECT_ROOT)
+        venv_path = Path(venv_path or Config.VENV_PATH)
+        python = str(venv_path / 'bin' / 'python')
+        details = {}
+
         try:
+            # compileall -j 0 uses a process pool sized to the CPU count
+            started = time.time()
             result = subprocess.run(
-                ['sudo', 'systemctl', 'restart', service_name],
+                [python, '-m', 'compileall', '-q', '-j', '0',
+                 '-x', r'(^|/)(\.git|\.venv|venv|node_modules)(/|$)', str(workdir)],
                 capture_output=True,
                 text=True,
-                timeout=60
+                timeout=Config.PREWARM_TIMEOUT
             )
+            details['compile_duration'] = round(time.time() - started, 3)
+            if result.returncode != 0:
+                raise Exception(f"Bytecode compilation failed: {(result.stdout + result.stderr).strip()[-500:]}")
 
-            if result.returncode == 0:
-                # Verify service is running
-                verify_result = subprocess.run(
-                    ['systemctl', 'is-active', service_name],
+            if Config.WSGI_MODULE:
+                started = time.time()
+                result = subprocess.run(
+                    [python, '-c', Deployer.IMPORT_CHECK_SCRIPT, str(workdir), Config.WSGI_MODULE],
+                    cwd=str(workdir),
                     capture_output=True,
                     text=True,
-                    timeout=10
+                    timeout=Config.PREWARM_TIMEOUT
                 )
+                details['import_duration'] = round(time.time() - started, 3)
+                if result.returncode != 0:
+                    raise Exception(f"Import of {Config.WSGI_MODULE} failed: {result.stderr.strip()[-500:]}")
+                details['import_check'] = Config.WSGI_MODULE
+
+            return {'success': True, **details}
+
+        except subprocess.TimeoutExpired:
+            raise Exception(f"Warm-up timed out after {Config.PREWARM_TIMEOUT}s")
+        except Exception as e:
+            raise Exception(f"Pre-restart warm-up failed: {str(e)}")
+
+    # ==========================
+    # RELEASE MODE
+    # ==========================
+    RELEASE_VENV = '.venv'
+    RELEASE_COMPLETE_MARKER = '.release-complete'
+
+    @staticmethod
+    def _git(args, timeout=120):
+        """Run a git command against the PROJECT_ROOT repository."""
+        result = subprocess.run(
+            ['git'] + args,
+            cwd=Config.PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        if result.returncode != 0:
+            raise Exception(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result.stdout.strip()
+
+    @staticmethod
+    def release_path(commit_hash):
+        """Directory a commit is built into."""
+        return Config.RELEASES_DIR / commit_hash[:12]
+
+    @staticmethod
+    def current_release():
+        """Resolved path of the active release, or None."""
+        try:
+            return Path(os.readlink(Config.CURRENT_LINK))
+        except OSError:
+            return None
+
+    @staticmethod
+    def prepare_release(commit_hash):
+        """Build a commit into its own worktree and venv while the live release keeps serving."""
+        release_dir = Deployer.release_path(commit_hash)
+        venv_dir = release_dir / Deployer.RELEASE_VENV
+
+        try:
+            if (release_dir / Deployer.RELEASE_COMPLETE_MARKER).exists():
+                logging.info(f"Release {release_dir.name} already built, reusing it")
+                return {'success': True, 'path': str(release_dir), 'reused': True}
+
+            # Make sure the commit is available locally (the watcher may have skipped the fetch)
+            try:
+                Deployer._git(['cat-file', '-e', f'{commit_hash}^{{commit}}'], timeout=30)
+            except Exception:
+                Deployer._git(['fetch', '--no-tags', Config.GIT_REMOTE, Config.GIT_BRANCH])
+
+            # Remove leftovers from an interrupted build
+            if release_dir.exists():
+                Deployer._remove_release(release_dir)
+
+            Config.RELEASES_DIR.mkdir(parents=True, exist_ok=True)
+            Deployer._git(['worktree', 'add', '--detach', str(release_dir), commit_hash])
+            logging.info(f"Created worktree {release_dir} at {commit_hash[:8]}")
+
+            result = subprocess.run(
+                [str(Path(Config.VENV_PATH) / 'bin' / 'python'), '-m', 'venv', str(venv_dir)],
+                capture_output=True,
+                text=True,
+                timeout=120
+            )
+            if result.returncode != 0:
+                raise Exception(f"venv creation failed: {result.stderr.strip()}")
+
+            dep_result = Deployer.update_dependencies(release_dir, venv_dir)
+
+            (release_dir / Deployer.RELEASE_COMPLETE_MARKER).touch()
+            return {'success': True, 'path': str(release_dir), 'dependencies': dep_result}
+
+        except Exception as e:
+            raise Exception(f"Failed to prepare release {commit_hash[:8]}: {str(e)}")
+
+    @staticmethod
+    def activate_release(release_dir):
+        """Atomically point CURRENT_LINK at a release directory."""
+        try:
+            previous = Deployer.current_release()
+            tmp_link = Config.CURRENT_LINK.with_name(f'.{Config.CURRENT_LINK.name}.tmp')
+            if os.path.lexists(tmp_link):
+                os.unlink(tmp_link)
+            os.symlink(str(release_dir), tmp_link)
+            os.replace(tmp_link, Config.CURRENT_LINK)  # rename(2) swaps the link atomically
+
+            logging.info(f"Switched {Config.CURRENT_LINK} -> {release_dir}")
+            return {
+                'success': True,
+                'current': str(release_dir),
+                'previous': str(previous) if previous else None
+            }
+        except Exception as e:
+            raise Exception(f"Failed to activate release: {str(e)}")
+
+    @staticmethod
+    def _remove_release(release_dir):
+        try:
+            Deployer._git(['worktree', 'remove', '--force', str(release_dir)])
+        except Exception as e:
+            logging.warning(f"git worktree remove failed for {release_dir}: {str(e)}")
+        if release_dir.exists():
+            shutil.rmtree(release_dir, ignore_errors=True)
+        Deployer._git(['worktree', 'prune'])
+
+    @staticmethod
+    def prune_releases(keep_paths=()):
+        """Remove old release directories beyond KEEP_RELEASES."""
+        keep = {Path(p).resolve() for p in keep_paths if p}
+        current = Deployer.current_release()
+        if current:
+            keep.add(current.resolve())
+
+        # Units skipped by selective restarts may still run from an older release
+        for proc in psutil.process_iter(['cwd']):
+            cwd = proc.info.get('cwd')
+            if cwd and cwd.startswith(str(Config.RELEASES_DIR)):
+                relative = Path(cwd).relative_to(Config.RELEASES_DIR)
+                if relative.parts:
+                    keep.add((Config.RELEASES_DIR / relative.parts[0]).resolve())
+
+        releases = sorted(
+            (d for d in Config.RELEASES_DIR.iterdir() if d.is_dir()),
+            key=lambda d: d.stat().st_mtime,
+            reverse=True
+        )
+
+        removed = []
+        for release_dir in releases[Config.KEEP_RELEASES:]:
+            if release_dir.resolve() in keep:
+                continue
+            Deployer._remove_release(release_dir)
+            removed.append(release_dir.name)
+        return removed
+
+    @staticmethod
+    def _systemctl(args, timeout=60):
+        """Run a privileged systemctl command, raising on failure."""
+        result = subprocess.run(
+            ['sudo', 'systemctl'] + args,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        if result.returncode != 0:
+            raise Exception(f"systemctl {args[0]} failed: {result.stderr.strip()}")
+
+    @staticmethod
+    def _signal_pid(pid, signal_name):
+        """Send a signal to a process the service user may not own."""
+        result = subprocess.run(
+            ['sudo', 'kill', '-s', signal_name, str(pid)],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        if result.returncode != 0:
+            raise Exception(f"kill -s {signal_name} {pid} failed: {result.stderr.strip()}")
+
+    @staticmethod
+    def _worker_pids(master_pid):
+        """PIDs of a gunicorn master's direct children."""
+        try:
+            return {child.pid for child in psutil.Process(master_pid).children()}
+        except psutil.Error:
+            return set()
+
+    @staticmethod
+    def _wait_for(condition, timeout, interval=0.5):
+        """Poll condition() until it returns a truthy value or timeout expires."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            value = condition()
+            if value:
+                return value
+            time.sleep(interval)
+        return None
+
+    @staticmethod
+    def _reload_hup(service_name, status):
+        """Graceful worker rotation: SIGHUP the master and wait until all workers are replaced."""
+        master = status.get('main_pid', 0)
+        old_workers = Deployer._worker_pids(master)
+        Deployer._systemctl(['kill', '-s', 'HUP', '--kill-who=main', service_name])
+
+        def rotated():
+            current = Deployer._worker_pids(master)
+            return current and not (current & old_workers) and len(current) >= len(old_workers)
+
+        if old_workers and not Deployer._wait_for(rotated, Config.RELOAD_TIMEOUT):
+            raise Exception(f"Workers of {service_name} were not replaced within {Config.RELOAD_TIMEOUT}s")
 
-                if verify_result.returncode == 0 and verify_result.stdout.strip() == 'active':
-                    return {'success': True, 'status': 'restarted and verified'}
+    @staticmethod
+    def _reload_usr2(service_name, status):
+        """Gunicorn binary upgrade: start a new master with USR2, then drain the old one.
+
+        Requires the unit to track the master through a PIDFile (Type=forking),
+        otherwise systemd stops the service when the old master exits.
+        """
+        old_master = status.get('main_pid', 0)
+        if not old_master:
+            raise Exception(f"{service_name} has no main PID to upgrade")
+        worker_count = len(Deployer._worker_pids(old_master))
+
+        Deployer._signal_pid(old_master, 'USR2')
+
+        def new_master_ready():
+            try:
+                for child in psutil.Process(old_master).children():
+                    if 'gunicorn' in ' '.join(child.cmdline()) and len(child.children()) >= max(worker_count, 1):
+                        return child.pid
+            except psutil.Error:
+                pass
+            return None
+
+        new_master = Deployer._wait_for(new_master_ready, Config.RELOAD_TIMEOUT)
+        if not new_master:
+            raise Exception(f"New {service_name} master did not come up within {Config.RELOAD_TIMEOUT}s")
+
+        # Stop old workers gracefully, then the old master
+        Deployer._signal_pid(old_master, 'WINCH')
+        Deployer._signal_pid(old_master, 'QUIT')
+        if not Deployer._wait_for(lambda: not psutil.pid_exists(old_master), Config.RELOAD_TIMEOUT):
+            raise Exception(f"Old {service_name} master {old_master} did not exit")
+
+    @staticmethod
+    def restart_service(service_name, strategy=None):
+        """Restart (or gracefully reload) a systemd service and confirm it is ready."""
+        strategy = strategy or Config.restart_strategy(service_name)
+        try:
+            if strategy == 'restart':
+                Deployer._systemctl(['restart', service_name])
+            else:
+                status = SystemdUnits.query_units([service_name])[service_name]
+                if status.get('active_state') != 'active':
+                    # Nothing to reload gracefully; fall back to a full start
+                    logging.info(f"{service_name} is not active, restarting instead of {strategy}")
+                    strategy = 'restart'
+                    Deployer._systemctl(['restart', service_name])
+                elif strategy == 'reload':
+                    Deployer._systemctl(['reload', service_name])
+                elif strategy == 'hup':
+                    Deployer._reload_hup(service_name, status)
+                elif strategy == 'usr2':
+                    Deployer._reload_usr2(service_name, status)
                 else:
-                    return {'success': False, 'error': 'Service restart failed verification'}
+                    raise Exception(f"Unknown restart strategy '{strategy}'")
+
+            # Verify service is running
+            if Deployer._wait_for(lambda: SystemdUnits.is_active(service_name), 10):
+                return {'success': True, 'status': f'{strategy} verified', 'strategy': strategy}
             else:
-                raise Exception(f"Service restart failed: {result.stderr}")
+                return {'success': False, 'error': 'Service restart failed verification', 'strategy': strategy}
 
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), 'strategy': strategy}
 
     @staticmethod
-    def restart_services():
-        """Restart all configured services."""
-        services = [
-            Config.GUNICORN_SERVICE,
-            Config.NGINX_SERVICE
-        ]
+    def plan_restarts(changed_files, requirements_changed=False):
+        """Decide which units to restart from the changed paths.
+
+        Returns {'units': patterns or None for the full RESTART_UNITS set,
+        'strategies': {pattern: strategy}, 'reason': str}.
+        """
+        rules = Config.restart_path_rules()
+        if changed_files is None or not rules:
+            return {'units': None, 'strategies': {}, 'reason': 'full restart (no path map)'}
+        if requirements_changed:
+            return {'units': None, 'strategies': {}, 'reason': 'full restart (requirements changed)'}
+
+        units = []
+        strategies = {}
+        for path in changed_files:
+            for path_glob, targets in rules:
+                if Config.path_matches(path, path_glob):
+                    for unit, strategy in targets:
+                        if unit not in units:
+                            units.append(unit)
+                        if strategy:
+                            strategies[unit] = strategy
+                    break
+            else:
+                return {'units': None, 'strategies': {}, 'reason': f'full restart ({path} has no rule)'}
 
-        results = []
-        failed_services = []
+        reason = f"selective restart: {', '.join(units)}" if units else 'no restart needed'
+        return {'units': units, 'strategies': strategies, 'reason': reason}
 
+    @staticmethod
+    def restart_services(units=None, strategies=None):
+        """Restart all configured (and discovered) services.
+
+        `units` optionally limits the restart to a list of unit names or
+        patterns, and `strategies` overrides the restart strategy per pattern.
+
+        Units are restarted concurrently (up to RESTART_WORKERS) except where
+        RESTART_DEPENDENCIES orders them, so the total time follows the
+        critical path rather than the sum of all restarts.
+        """
+        patterns = Config.restart_unit_patterns() if units is None else units
+        services, unmatched, discovery_failed = SystemdUnits.resolve(patterns)
+        dependencies = Config.restart_dependencies(services)
+        strategies = strategies or {}
+
+        def strategy_for(service):
+            for pattern, strategy in strategies.items():
+                if fnmatch.fnmatch(service, pattern) or fnmatch.fnmatch(service, f"{pattern}.service"):
+                    return strategy
+            return None
+
+        graph = TaskGraph()
         for service in services:
-            if service and not service.startswith('<'):  # Skip if placeholder
-                result = Deployer.restart_service(service)
-                results.append({'name': service, 'result': result})
+            graph.add(
+                service,
+                lambda s=service: Deployer.restart_service(s, strategy_for(s)),
+                after=dependencies[service]
+            )
 
-                if not result.get('success', False):
-                    failed_services.append(service)
-            else:
-                results.append({
-                    'name': service or 'Unknown Service',
-                    'result': {'success': False, 'error': 'Service name not configured'}
-                })
+        started = time.time()
+        outcomes = graph.run(max_workers=Config.RESTART_WORKERS)
+        # Cached statuses of these units are from before the restart
+        HEALTH_CACHE.invalidate_units(services)
+
+        results = []
+        failed_services = []
+
+        for service, outcome in outcomes.items():
+            result = outcome['result'] or {'success': False, 'error': outcome.get('error', 'Unknown error')}
+            result['duration'] = outcome['duration']
+            results.append({
+                'name': service,
+                'result': result,
+                'after': dependencies[service],
+                'started': outcome['started']
+            })
+            logging.info(f"Restart {service}: {outcome['status']} in {outcome['duration']:.2f}s")
+
+            if outcome['status'] != 'success':
+                failed_services.append(service)
+
+        for pattern in unmatched:
+            logging.warning(f"No units matched restart pattern '{pattern}'")
+            results.append({
+                'name': pattern,
+                'result': {'success': True, 'status': 'no matching units'}
+            })
+
+        # Patterns that could not be resolved may hide units that needed a restart
+        for pattern in discovery_failed:
+            results.append({
+                'name': pattern,
+                'result': {'success': False, 'error': 'Unit discovery failed (systemctl list-units)'}
+            })
+            failed_services.append(pattern)
+
+        if not services and not unmatched and not discovery_failed and units is None:
+            results.append({
+                'name': 'Unknown Service',
+                'result': {'success': False, 'error': 'Service name not configured'}
+            })
 
         return {
             'results': results,
+            'units': services,
             'failed_services': failed_services,
-            'all_success': len(failed_services) == 0
+            'all_success': len(failed_services) == 0,
+            'duration': round(time.time() - started, 3)
         }
 
     @staticmethod
-    def verify_deployment():
-        """Verify that deployment was successful."""
+    def verify_deployment(units=None):
+        """Verify that deployment was successful.
+
+        Waits on the readiness gate: the restarted `units` (default: all
+        RESTART_UNITS) must become active and every READINESS_URLS endpoint
+        must answer, within READINESS_TIMEOUT. An empty list means nothing
+        was restarted, so there is nothing to gate.
+        """
+        if units is not None and not units:
+            return {
+                'services_ok': True,
+                'service_statuses': [],
+                'app_check': {'performed': False, 'success': True, 'endpoints': []},
+                'time_to_ready': 0.0,
+                'overall_success': True
+            }
+
         try:
-            # Check if services are running
-            services_ok = True
+            if units is None:
+                units, _, _ = SystemdUnits.resolve(Config.restart_unit_patterns())
+            services_to_check = list(units)
+            gate = ReadinessGate(units=services_to_check).wait()
+
+            # Share the gate's final observation with health checks and the exporter
+            statuses = gate['units'].get('statuses')
+            if statuses:
+                HEALTH_CACHE.put_units(statuses)
+            else:
+                statuses = HEALTH_CACHE.unit_statuses(services_to_check)
             service_statuses = []
-
-            services_to_check = [Config.GUNICORN_SERVICE, Config.NGINX_SERVICE]
             for service in services_to_check:
-                if service and not service.startswith('<'):
-                    result = subprocess.run(
-                        ['systemctl', 'is-active', service],
-                        capture_output=True,
-                        text=True,
-                        timeout=10
-                    )
-                    is_active = result.returncode == 0 and result.stdout.strip() == 'active'
-                    service_statuses.append({'name': service, 'active': is_active})
-                    if not is_active:
-                        services_ok = False
-
-            # Basic health check - try to access the application
-            # This is optional and depends on your setup
-            app_check = {'performed': False, 'success': False}
+                status = statuses[service]
+                service_statuses.append({
+                    'name': service,
+                    'active': status.get('active_state') == 'active',
+                    'sub_state': status.get('sub_state', ''),
+                    'main_pid': status.get('main_pid', 0),
+                    'restarts': status.get('restarts', 0)
+                })
+            services_ok = all(s['active'] for s in service_statuses)
+
+            app_check = {
+                'performed': bool(gate['urls']),
+                'success': all(r['ready'] for r in gate['urls'].values()),
+                'endpoints': [
+                    {
+                        'url': url,
+                        'ready': r['ready'],
+                        'status': r.get('status'),
+                        'attempts': r['attempts'],
+                        'time_to_ready': r['time_to_ready'],
+                        'error': r.get('error') if not r['ready'] else None
+                    }
+                    for url, r in gate['urls'].items()
+                ]
+            }
 
             return {
                 'services_ok': services_ok,
                 'service_statuses': service_statuses,
                 'app_check': app_check,
-                'overall_success': services_ok
+                'time_to_ready': gate['time_to_ready'],
+                'overall_success': services_ok and app_check['success']
             }
 
         except Exception as e:
@@ -185,46 +710,211 @@ class Deployer:
             }
 
     @staticmethod
-    def run_deployment(commit_hash, requirements_changed):
+    def _run_step(deployment_log, name, func):
+        """Run one deployment step, recording its status, details and duration."""
+        step = {'step': name, 'status': 'running'}
+        deployment_log['steps'].append(step)
+        started = time.time()
+        try:
+            result = func()
+            step['status'] = 'success'
+            step['details'] = result
+            return result
+        finally:
+            step['duration'] = round(time.time() - started, 3)
+
+    @staticmethod
+    def _fail_step(step, message):
+        """Mark a step that ran but whose result did not pass; returns the exception to raise."""
+        step['status'] = 'failed'
+        step['error'] = message
+        return Exception(message)
+
+    @staticmethod
+    def _run_hooks(deployment_log, stage, workdir, venv_path, hooks):
+        """Run the deploy hooks for a stage and append their steps to the log."""
+        steps = DeployHooks.run(stage, deployment_log.get('changed_files'), workdir, venv_path, hooks)
+        deployment_log['steps'].extend(steps)
+
+        failed = [s['step'] for s in steps if s['status'] == 'failed']
+        if failed:
+            raise Exception(f"Deploy hooks failed: {', '.join(failed)}")
+
+    # Failed steps that point at the commit itself rather than a transient problem
+    CODE_FAILURE_STEPS = ('prewarm', 'restart_services', 'verify_deployment', 'benchmark')
+
+    @staticmethod
+    def rollback(deployment_log, previous_commit):
+        """Restore the previous known-good release or commit and restart services."""
+        rollback_log = {'steps': []}
+        started = time.time()
+
+        try:
+            if deployment_log.get('mode') == 'release':
+                previous = (deployment_log.get('release') or {}).get('previous')
+                if not previous:
+                    raise Exception("No previous release to roll back to")
+                rollback_log['target'] = previous
+                Deployer._run_step(rollback_log, 'restore_release', lambda: Deployer.activate_release(previous))
+            else:
+                if not previous_commit:
+                    raise Exception("No previous commit to roll back to")
+                rollback_log['target'] = previous_commit
+                Deployer._run_step(
+                    rollback_log, 'restore_commit',
+                    lambda: {'success': True, 'output': Deployer._git(['reset', '--hard', previous_commit])}
+                )
+                if deployment_log.get('requirements_changed'):
+                    # The previous requirements set is normally still in the wheelhouse cache
+                    Deployer._run_step(rollback_log, 'restore_dependencies', Deployer.update_dependencies)
+
+            restart_result = Deployer._run_step(rollback_log, 'restart_services', Deployer.restart_services)
+            if not restart_result.get('all_success', False):
+                raise Exception(f"Restart failed for: {', '.join(restart_result.get('failed_services', []))}")
+
+            verify_result = Deployer._run_step(
+                rollback_log, 'verify_deployment', lambda: Deployer.verify_deployment(restart_result['units'])
+            )
+            if not verify_result.get('overall_success', False):
+                raise Exception("Verification of the restored version failed")
+
+            rollback_log['success'] = True
+
+        except Exception as e:
+            if rollback_log['steps'] and rollback_log['steps'][-1]['status'] != 'failed':
+                rollback_log['steps'][-1]['status'] = 'failed'
+                rollback_log['steps'][-1]['error'] = str(e)
+            rollback_log['success'] = False
+            rollback_log['error'] = str(e)
+            logging.error(f"Rollback failed: {str(e)}")
+
+        rollback_log['duration'] = round(time.time() - started, 3)
+        logging.info(f"Rollback {'succeeded' if rollback_log['success'] else 'failed'} "
+                     f"in {rollback_log['duration']:.2f}s")
+        return rollback_log
+
+    @staticmethod
+    def run_deployment(commit_hash, requirements_changed, changed_files=None, previous_commit=None):
         """Run complete deployment process."""
         deployment_log = {
             'commit_hash': commit_hash,
+            'previous_commit': previous_commit,
             'requirements_changed': requirements_changed,
+            'changed_files': changed_files,
             'steps': []
         }
 
+        release_mode = Config.DEPLOY_MODE == 'release'
+        deployment_log['mode'] = Config.DEPLOY_MODE
+        started = time.time()
+        # Names the failure when an error is raised outside of a recorded step
+        stage = 'deployment'
+
         try:
-            # Step 1: Pull changes
-            deployment_log['steps'].append({'step': 'pull_changes', 'status': 'running'})
-            pull_result = Deployer.pull_latest_changes()
-            deployment_log['steps'][-1]['status'] = 'success'
-            deployment_log['steps'][-1]['details'] = pull_result
-
-            # Step 2: Update dependencies if needed
-            if requirements_changed:
-                deployment_log['steps'].append({'step': 'update_dependencies', 'status': 'running'})
-                dep_result = Deployer.update_dependencies()
-                deployment_log['steps'][-1]['status'] = 'success'
-                deployment_log['steps'][-1]['details'] = dep_result
-
-            # Step 3: Restart services
-            deployment_log['steps'].append({'step': 'restart_services', 'status': 'running'})
-            restart_result = Deployer.restart_services()
-            deployment_log['steps'][-1]['status'] = 'success'
-            deployment_log['steps'][-1]['details'] = restart_result
+            # Validate the hooks file before any new code is put in place
+            hooks = Deployer._run_step(deployment_log, 'load_hooks', DeployHooks.load)
+
+            if release_mode:
+                # Step 1: Build the new release alongside the live one
+                release_result = Deployer._run_step(
+                    deployment_log, 'prepare_release', lambda: Deployer.prepare_release(commit_hash)
+                )
+                workdir = Path(release_result['path'])
+                venv_path = workdir / Deployer.RELEASE_VENV
+
+                # Step 2: Pre-restart hooks run against the new release before it goes live
+                stage = 'pre_restart_hooks'
+                Deployer._run_hooks(deployment_log, 'pre_restart', workdir, venv_path, hooks)
+
+                # Step 3: Compile and import-check the new release
+                if Config.PREWARM_ENABLED:
+                    Deployer._run_step(deployment_log, 'prewarm', lambda: Deployer.prewarm(workdir, venv_path))
+
+                # Step 4: Switch the current symlink
+                deployment_log['release'] = Deployer._run_step(
+                    deployment_log, 'activate_release', lambda: Deployer.activate_release(workdir)
+                )
+            else:
+                workdir = Path(Config.PROJECT_ROOT)
+                venv_path = Path(Config.VENV_PATH)
+
+                # Step 1: Pull changes
+                Deployer._run_step(deployment_log, 'pull_changes', Deployer.pull_latest_changes)
+
+                # Step 2: Update dependencies if needed
+                if requirements_changed:
+                    Deployer._run_step(deployment_log, 'update_dependencies', Deployer.update_dependencies)
+
+                # Step 3: Pre-restart hooks (migrations, static files, ...)
+                stage = 'pre_restart_hooks'
+                Deployer._run_hooks(deployment_log, 'pre_restart', workdir, venv_path, hooks)
+
+                # Step 4: Compile and import-check before touching running services
+                if Config.PREWARM_ENABLED:
+                    Deployer._run_step(deployment_log, 'prewarm', lambda: Deployer.prewarm(workdir, venv_path))
+
+            # Step 5: Restart services
+            stage = 'plan_restarts'
+            restart_plan = Deployer.plan_restarts(changed_files, requirements_changed)
+            deployment_log['restart_plan'] = restart_plan
+            logging.info(f"Restart plan: {restart_plan['reason']}")
+
+            restart_result = Deployer._run_step(
+                deployment_log, 'restart_services',
+                lambda: Deployer.restart_services(restart_plan['units'], restart_plan['strategies'])
+            )
+            restart_result['plan'] = restart_plan['reason']
 
             if not restart_result.get('all_success', False):
                 failed_services = restart_result.get('failed_services', [])
-                raise Exception(f"Service restart failed for: {', '.join(failed_services)}")
+                raise Deployer._fail_step(deployment_log['steps'][-1],
+                                          f"Service restart failed for: {', '.join(failed_services)}")
 
-            # Step 4: Verify deployment
-            deployment_log['steps'].append({'step': 'verify_deployment', 'status': 'running'})
-            verify_result = Deployer.verify_deployment()
-            deployment_log['steps'][-1]['status'] = 'success'
-            deployment_log['steps'][-1]['details'] = verify_result
+            # Step 6: Verify deployment
+            verify_result = Deployer._run_step(
+                deployment_log, 'verify_deployment', lambda: Deployer.verify_deployment(restart_result['units'])
+            )
+            deployment_log['time_to_ready'] = verify_result.get('time_to_ready')
 
             if not verify_result.get('overall_success', False):
-                raise Exception("Deployment verification failed")
+                not_ready = [s['name'] for s in verify_result.get('service_statuses', []) if not s['active']]
+                not_ready += [e['url'] for e in verify_result.get('app_check', {}).get('endpoints', [])
+                              if not e['ready']]
+                detail = f" (not ready: {', '.join(not_ready)})" if not_ready else ""
+                raise Deployer._fail_step(deployment_log['steps'][-1], f"Deployment verification failed{detail}")
+
+            # Step 7: Latency benchmark against the last good deploy
+            benchmark = None
+            if Config.BENCHMARK_ENABLED:
+                benchmark = Deployer._run_step(
+                    deployment_log, 'benchmark', lambda: LatencyBenchmark.run_gate(commit_hash)
+                )
+                deployment_log['benchmark'] = benchmark
+                if not benchmark['success'] and Config.BENCHMARK_ACTION == 'fail':
+                    raise Deployer._fail_step(deployment_log['steps'][-1],
+                                              f"Latency regression: {'; '.join(benchmark['regressions'])}")
+
+            # Step 8: Post-restart hooks
+            stage = 'post_restart_hooks'
+            Deployer._run_hooks(deployment_log, 'post_restart', workdir, venv_path, hooks)
+
+            # The baseline is the latency of the code that is live. A regression
+            # accepted with BENCHMARK_ACTION=warn stays live, so it becomes the new
+            # baseline too; otherwise every later deploy would warn against an
+            # older, faster tree. With 'fail' a regressed deploy never gets here.
+            if benchmark and benchmark['results']:
+                try:
+                    LatencyBenchmark.save_baseline(benchmark['results'], commit_hash)
+                except Exception as e:
+                    logging.warning(f"Failed to save benchmark baseline: {str(e)}")
+
+            if release_mode:
+                try:
+                    deployment_log['pruned_releases'] = Deployer.prune_releases(
+                        [deployment_log['release'].get('previous')]
+                    )
+                except Exception as e:
+                    logging.warning(f"Failed to prune old releases: {str(e)}")
 
             # Success
             deployment_log['success'] = True
@@ -233,12 +923,34 @@ class Deployer:
             return deployment_log
 
         except Exception as e:
-            # Mark failed step
-            if deployment_log['steps']:
-                deployment_log['steps'][-1]['status'] = 'failed'
-                deployment_log['steps'][-1]['error'] = str(e)
+            steps = deployment_log['steps']
+
+            # Decide before touching any status: roll back only if the new code was put in place,
+            # and blame the commit only for failures of the code itself
+            went_live = any(
+                step['step'] in ('activate_release', 'pull_changes') and step['status'] == 'success'
+                for step in steps
+            )
+            failed_steps = [step['step'] for step in steps if step['status'] in ('failed', 'running')]
+            deployment_log['bad_commit'] = any(
+                name in Deployer.CODE_FAILURE_STEPS or name.startswith('hook_') for name in failed_steps
+            )
+
+            # A step still running is the one that raised; hook and checked steps record their own failures
+            for step in steps:
+                if step['status'] == 'running':
+                    step['status'] = 'failed'
+                    step['error'] = str(e)
+            if not any(step['status'] == 'failed' for step in steps):
+                steps.append({'step': stage, 'status': 'failed', 'duration': 0.0, 'error': str(e)})
 
             deployment_log['success'] = False
             deployment_log['error'] = str(e)
+            if Config.ROLLBACK_ENABLED and went_live:
+                logging.warning(f"Deployment of {commit_hash[:8]} failed, rolling back")
+                deployment_log['rollback'] = Deployer.rollback(deployment_log, previous_commit)
 
             return deployment_log
+
+        finally:
+            deployment_log['duration'] = round(time.time() - started, 3)
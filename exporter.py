@@ -0,0 +1,246 @@
+"""
+Server Angel Exporter Module
+Prometheus/OpenMetrics /metrics endpoint served from a periodically refreshed snapshot.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import psutil
+from config import Config
+
+
+class DeployStats:
+    """Deployment counters persisted in DEPLOY_STATS_FILE across runs."""
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def load():
+        try:
+            with open(Config.DEPLOY_STATS_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {
+                'deploys': {'success': 0, 'failed': 0},
+                'rollbacks': {'success': 0, 'failed': 0},
+                'duration_sum': 0.0,
+                'last_deploy': None
+            }
+
+    @staticmethod
+    def record(deployment_log):
+        """Add one finished deployment to the counters."""
+        with DeployStats._lock:
+            stats = DeployStats.load()
+            result = 'success' if deployment_log.get('success') else 'failed'
+            stats['deploys'][result] += 1
+            stats['duration_sum'] += deployment_log.get('duration', 0.0)
+
+            rollback = deployment_log.get('rollback')
+            if rollback:
+                stats['rollbacks']['success' if rollback.get('success') else 'failed'] += 1
+
+            stats['last_deploy'] = {
+                'commit': deployment_log.get('commit_hash', ''),
+                'timestamp': time.time(),
+                'success': bool(deployment_log.get('success')),
+                'duration': deployment_log.get('duration', 0.0),
+                'time_to_ready': deployment_log.get('time_to_ready')
+            }
+
+            Config.DEPLOY_STATS_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = Config.DEPLOY_STATS_FILE.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp_path, Config.DEPLOY_STATS_FILE)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the exporter's cached snapshot; never collects anything itself."""
+
+    def log_message(self, format, *args):
+        logging.debug(f"Exporter {self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        exporter = self.server.exporter
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+        body, content_type = exporter.payload(openmetrics)
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    """Renders health and deploy data as OpenMetrics text on a timer.
+
+    A background thread refreshes the snapshot every EXPORTER_REFRESH_INTERVAL
+    seconds; scrapes only copy the pre-encoded bytes.
+    """
+
+    OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    TEXT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, host=None, port=None, interval=None):
+        self.host = host or Config.EXPORTER_HOST
+        self.port = Config.EXPORTER_PORT if port is None else port
+        self.interval = interval or Config.EXPORTER_REFRESH_INTERVAL
+        self._payloads = (b'# EOF\n', b'')
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server = None
+        self._threads = []
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{k}="{MetricsExporter._escape(v)}"' for k, v in labels.items()) + '}'
+
+    @staticmethod
+    def render(health_data, deploy_stats, collected_at, collect_duration):
+        """Build the exposition as (openmetrics_lines, text_format_lines).
+
+        Counters follow OpenMetrics naming (family without `_total`); the
+        classic text format declares the full sample name instead.
+        """
+        families = []
+
+        def family(name, kind, help_text, samples):
+            families.append((name, kind, help_text, samples))
+
+        metrics = health_data.get('system', {}).get('metrics', {})
+        if metrics:
+            family('server_angel_cpu_usage_percent', 'gauge', 'CPU usage from the rolling sampler',
+                   [('', {}, metrics['cpu_percent'])])
+            family('server_angel_memory_usage_percent', 'gauge', 'Memory usage',
+                   [('', {}, metrics['memory_percent'])])
+            family('server_angel_disk_usage_percent', 'gauge', 'Root filesystem usage',
+                   [('', {}, metrics['disk_percent'])])
+            family('server_angel_load_average', 'gauge', 'System load average',
+                   [('', {'period': p}, metrics[f'load_{p}']) for p in ('1', '5', '15')])
+        family('server_angel_boot_time_seconds', 'gauge', 'System boot time',
+               [('', {}, psutil.boot_time())])
+
+        units = [s for s in health_data.get('services', []) if s.get('status') not in ('NOT_CONFIGURED',)]
+        family('server_angel_unit_up', 'gauge', '1 if the unit is running',
+               [('', {'unit': s['name']}, 1 if s.get('status') in ('RUNNING', 'OK') else 0) for s in units])
+        family('server_angel_unit_restarts', 'counter', 'Automatic restarts reported by systemd (NRestarts)',
+               [('_total', {'unit': s['name']}, s.get('restarts', 0)) for s in units if 'restarts' in s])
+
+        collectors = health_data.get('collectors', {})
+        if collectors:
+            family('server_angel_collector_up', 'gauge', '1 if the collector returned OK or WARNING',
+                   [('', {'collector': n}, 1 if c['status'] in ('OK', 'WARNING') else 0)
+                    for n, c in collectors.items() if c['status'] != 'NOT_CONFIGURED'])
+            family('server_angel_collector_duration_seconds', 'gauge', 'Time the collector took',
+                   [('', {'collector': n}, c['latency'])
+                    for n, c in collectors.items() if c['status'] != 'NOT_CONFIGURED'])
+
+        deploys = deploy_stats['deploys']
+        family('server_angel_deploys', 'counter', 'Deployments by result',
+               [('_total', {'result': r}, deploys[r]) for r in ('success', 'failed')])
+        family('server_angel_rollbacks', 'counter', 'Automatic rollbacks by result',
+               [('_total', {'result': r}, deploy_stats['rollbacks'][r]) for r in ('success', 'failed')])
+        family('server_angel_deploy_duration_seconds', 'summary', 'Deployment duration',
+               [('_sum', {}, deploy_stats['duration_sum']), ('_count', {}, sum(deploys.values()))])
+
+        last = deploy_stats.get('last_deploy')
+        if last:
+            family('server_angel_last_deploy', 'info', 'Most recent deployment',
+                   [('_info', {'commit': last['commit'], 'result': 'success' if last['success'] else 'failed'}, 1)])
+            family('server_angel_last_deploy_timestamp_seconds', 'gauge', 'When the last deployment finished',
+                   [('', {}, last['timestamp'])])
+            family('server_angel_last_deploy_duration_seconds', 'gauge', 'Duration of the last deployment',
+                   [('', {}, last['duration'])])
+            if last.get('time_to_ready') is not None:
+                family('server_angel_last_deploy_time_to_ready_seconds', 'gauge',
+                       'Seconds from restart to ready in the last deployment', [('', {}, last['time_to_ready'])])
+
+        family('server_angel_snapshot_timestamp_seconds', 'gauge', 'When this snapshot was collected',
+               [('', {}, collected_at)])
+        family('server_angel_snapshot_duration_seconds', 'gauge', 'Time spent collecting this snapshot',
+               [('', {}, collect_duration)])
+
+        openmetrics, text = [], []
+        for name, kind, help_text, samples in families:
+            # Info metrics do not exist in the classic format; expose them as gauges there
+            text_kind = 'gauge' if kind == 'info' else kind
+            text_name = f'{name}_total' if kind == 'counter' else f'{name}_info' if kind == 'info' else name
+            openmetrics += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            text += [f'# HELP {text_name} {help_text}', f'# TYPE {text_name} {text_kind}']
+            for suffix, labels, value in samples:
+                line = f'{name}{suffix}{MetricsExporter._labels(labels)} {float(value)!r}'
+                openmetrics.append(line)
+                text.append(line)
+        openmetrics.append('# EOF')
+
+        return openmetrics, text
+
+    def refresh(self):
+        """Collect fresh data and swap in a new pre-encoded snapshot."""
+        from health_checks import HealthChecker
+
+        started = time.time()
+        health_data = HealthChecker.run_full_health_check()
+        openmetrics, text = MetricsExporter.render(
+            health_data, DeployStats.load(), started, time.time() - started
+        )
+        payloads = (('\n'.join(openmetrics) + '\n').encode(), ('\n'.join(text) + '\n').encode())
+        with self._lock:
+            self._payloads = payloads
+
+    def payload(self, openmetrics=True):
+        """Return (body, content_type) for a scrape."""
+        with self._lock:
+            body = self._payloads[0] if openmetrics else self._payloads[1]
+        return body, self.OPENMETRICS_TYPE if openmetrics else self.TEXT_TYPE
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Metrics snapshot refresh failed: {str(e)}")
+            self._stopped.wait(self.interval)
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        """Start the refresher and the HTTP server in daemon threads."""
+        self._stopped.clear()
+        self._server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.exporter = self
+        self._threads = [
+            threading.Thread(target=self._refresh_loop, name='metrics-refresh', daemon=True),
+            threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Metrics exporter on http://{self.address[0]}:{self.address[1]}/metrics")
+
+    def stop(self):
+        """Stop serving and refreshing."""
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self._server = None
+        self._threads = []
@@ -4,27 +4,117 @@ Monitors GitHub branch for new commits and triggers deployments.
 """
 
 import subprocess
-import os
+import json
 import logging
+import os
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 from config import Config
 
 
+class GitSession:
+    """Runs git plumbing against one repository without changing the process cwd.
+
+    Every call is timed, and object lookups go through a single long-lived
+    `git cat-file --batch-check` process instead of one fork per lookup.
+    """
+
+    def __init__(self, repo=None):
+        self.repo = str(repo or Config.PROJECT_ROOT)
+        self.timings = []
+        self._cat_file = None
+        self._cat_file_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def run(self, args, timeout=30):
+        """Run a git command in the repository and record how long it took."""
+        started = time.time()
+        try:
+            return subprocess.run(
+                ['git'] + args,
+                cwd=self.repo,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        finally:
+            self.timings.append({'command': f"git {args[0]}", 'duration': round(time.time() - started, 3)})
+
+    def object_type(self, rev):
+        """Return the object type ('commit', 'tree', ...) for rev, or None if missing."""
+        with self._cat_file_lock:
+            started = time.time()
+            if self._cat_file is None or self._cat_file.poll() is not None:
+                self._cat_file = subprocess.Popen(
+                    ['git', 'cat-file', '--batch-check'],
+                    cwd=self.repo,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True
+                )
+
+            self._cat_file.stdin.write(f"{rev}\n")
+            self._cat_file.stdin.flush()
+            line = self._cat_file.stdout.readline().split()
+            self.timings.append({'command': 'git cat-file', 'duration': round(time.time() - started, 3)})
+
+        if len(line) == 3:
+            return line[1]
+        return None
+
+    def change_set(self, base, target):
+        """Return commits and changed paths for base..target in one `git log` call."""
+        result = self.run(
+            ['log', '--format=%x00%H', '--name-only', '--no-renames', f'{base}..{target}', '--'],
+            timeout=60
+        )
+        if result.returncode != 0:
+            raise Exception(f"Git log failed: {result.stderr.strip()}")
+
+        commits = []
+        changed_files = set()
+        for line in result.stdout.splitlines():
+            if line.startswith('\x00'):
+                commits.append(line[1:])
+            elif line:
+                changed_files.add(line)
+
+        changed_files = sorted(changed_files)
+        return {
+            'commits': commits,
+            'changed_files': changed_files,
+            'requirements_changed': 'requirements.txt' in changed_files
+        }
+
+    def close(self):
+        """Stop the cat-file helper process."""
+        with self._cat_file_lock:
+            if self._cat_file is not None:
+                try:
+                    self._cat_file.stdin.close()
+                    self._cat_file.wait(timeout=5)
+                except Exception:
+                    self._cat_file.kill()
+                self._cat_file = None
+
+
 class GitWatcher:
     """Handles Git repository monitoring and commit detection."""
 
     @staticmethod
-    def get_current_commit():
+    def get_current_commit(session=None):
         """Get current commit hash from the repository."""
+        session = session or GitSession()
         try:
-            os.chdir(Config.PROJECT_ROOT)
-
-            result = subprocess.run(
-                ['git', 'rev-parse', 'HEAD'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            result = session.run(['rev-parse', 'HEAD'])
 
             if result.returncode == 0:
                 return result.stdout.strip()
@@ -35,7 +125,7 @@ class GitWatcher:
             raise Exception(f"Failed to get current commit: {str(e)}")
 
     @staticmethod
-    def get_last_deployed_commit():
+    def get_last_deployed_commit(session=None):
         """Get the last deployed commit hash from state file."""
         try:
             if Config.LAST_COMMIT_FILE.exists():
@@ -43,7 +133,7 @@ class GitWatcher:
                     return f.read().strip()
             else:
                 # If no state file exists, get current commit and save it
-                current = GitWatcher.get_current_commit()
+                current = GitWatcher.get_current_commit(session)
                 GitWatcher.save_last_deployed_commit(current)
                 return current
 
@@ -61,19 +151,63 @@ class GitWatcher:
             raise Exception(f"Failed to save last deployed commit: {str(e)}")
 
     @staticmethod
-    def fetch_remote():
-        """Fetch latest changes from remote repository."""
+    def get_bad_commits():
+        """Return {commit_hash: {'reason', 'time'}} for commits that failed to deploy."""
         try:
-            os.chdir(Config.PROJECT_ROOT)
-            logging.info(f"Fetching from remote: {Config.GIT_REMOTE}")
+            with open(Config.BAD_COMMITS_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
-            result = subprocess.run(
-                ['git', 'fetch', Config.GIT_REMOTE],
-                capture_output=True,
-                text=True,
-                timeout=60
+    @staticmethod
+    def mark_bad_commit(commit_hash, reason):
+        """Record a commit whose deployment failed so it is not retried every cycle."""
+        try:
+            bad = GitWatcher.get_bad_commits()
+            bad[commit_hash] = {'reason': reason, 'time': datetime.now().isoformat()}
+            # Keep the file small; only the newest entries matter
+            bad = dict(sorted(bad.items(), key=lambda item: item[1]['time'])[-20:])
+
+            Config.BAD_COMMITS_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = Config.BAD_COMMITS_FILE.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(bad, f, indent=2)
+            os.replace(tmp_path, Config.BAD_COMMITS_FILE)
+        except Exception as e:
+            raise Exception(f"Failed to record bad commit: {str(e)}")
+
+    @staticmethod
+    def get_remote_tip(session=None):
+        """Get the remote branch tip with `git ls-remote` (no objects transferred)."""
+        session = session or GitSession()
+        try:
+            result = session.run(
+                ['ls-remote', '--heads', Config.GIT_REMOTE, f'refs/heads/{Config.GIT_BRANCH}']
             )
 
+            if result.returncode != 0:
+                raise Exception(f"Git ls-remote failed: {result.stderr.strip()}")
+
+            for line in result.stdout.splitlines():
+                sha, _, ref = line.partition('\t')
+                if ref.strip() == f'refs/heads/{Config.GIT_BRANCH}':
+                    return sha.strip()
+
+            raise Exception(f"Branch {Config.GIT_BRANCH} not found on {Config.GIT_REMOTE}")
+
+        except subprocess.TimeoutExpired:
+            raise Exception("Git ls-remote timed out")
+
+    @staticmethod
+    def fetch_remote(session=None):
+        """Fetch the production branch from the remote repository."""
+        session = session or GitSession()
+        try:
+            logging.info(f"Fetching {Config.GIT_BRANCH} from remote: {Config.GIT_REMOTE}")
+
+            refspec = f'+refs/heads/{Config.GIT_BRANCH}:refs/remotes/{Config.GIT_REMOTE}/{Config.GIT_BRANCH}'
+            result = session.run(['fetch', '--no-tags', Config.GIT_REMOTE, refspec], timeout=60)
+
             if result.returncode != 0:
                 logging.error(f"Git fetch failed: {result.stderr}")
                 raise Exception(f"Git fetch failed: {result.stderr}")
@@ -87,96 +221,95 @@ class GitWatcher:
             raise Exception(f"Failed to fetch from remote: {str(e)}")
 
     @staticmethod
-    def check_for_new_commits():
-        """Check if there are new commits on the production branch."""
-        try:
-            # Fetch latest changes
-            GitWatcher.fetch_remote()
+    def check_for_new_commits(session=None, last_deployed=None):
+        """Check if there are new commits on the production branch.
 
+        Returns the full change set (commits, changed paths and whether
+        requirements.txt changed) for last_deployed..remote/branch.
+        """
+        session = session or GitSession()
+        try:
             # Get last deployed commit
-            last_deployed = GitWatcher.get_last_deployed_commit()
+            if last_deployed is None:
+                last_deployed = GitWatcher.get_last_deployed_commit(session)
 
-            # Check if remote branch has new commits
-            os.chdir(Config.PROJECT_ROOT)
+            # Fast path: compare the remote tip before transferring anything
+            try:
+                remote_tip = GitWatcher.get_remote_tip(session)
+            except Exception as e:
+                logging.warning(f"Remote tip check failed, falling back to fetch: {str(e)}")
+                remote_tip = None
 
-            result = subprocess.run(
-                ['git', 'rev-list', f'{last_deployed}..{Config.GIT_REMOTE}/{Config.GIT_BRANCH}'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            if remote_tip and remote_tip == last_deployed:
+                return {
+                    'new_commits': False,
+                    'message': 'No new commits detected'
+                }
 
-            if result.returncode == 0:
-                new_commits = result.stdout.strip().split('\n')
-                new_commits = [c for c in new_commits if c]  # Remove empty strings
+            if remote_tip and remote_tip in GitWatcher.get_bad_commits():
+                return {
+                    'new_commits': False,
+                    'message': f'Remote tip {remote_tip[:8]} failed to deploy before; waiting for a new commit'
+                }
 
-                if new_commits:
-                    latest_commit = new_commits[0]  # Most recent commit
-                    return {
-                        'new_commits': True,
-                        'commit_hash': latest_commit,
-                        'commit_count': len(new_commits)
-                    }
-                else:
-                    return {
-                        'new_commits': False,
-                        'message': 'No new commits detected'
-                    }
+            # Only fetch when the remote tip is not already available locally
+            if remote_tip is None or session.object_type(remote_tip) != 'commit':
+                GitWatcher.fetch_remote(session)
             else:
-                raise Exception(f"Git rev-list failed: {result.stderr}")
+                logging.info("Remote tip already present locally, skipping fetch")
 
-        except Exception as e:
-            raise Exception(f"Failed to check for new commits: {str(e)}")
-
-    @staticmethod
-    def check_requirements_changed():
-        """Check if requirements.txt has changed since last deployment."""
-        try:
-            os.chdir(Config.PROJECT_ROOT)
-
-            # Get last deployed commit
-            last_deployed = GitWatcher.get_last_deployed_commit()
-
-            # Check if requirements.txt changed
-            result = subprocess.run(
-                ['git', 'diff', '--name-only', last_deployed, 'HEAD', 'requirements.txt'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            if session.object_type(last_deployed) != 'commit':
+                raise Exception(f"Last deployed commit {last_deployed[:8]} not found in repository")
 
-            if result.returncode == 0:
-                changed_files = result.stdout.strip().split('\n')
-                changed_files = [f for f in changed_files if f]  # Remove empty strings
+            target = remote_tip or f'{Config.GIT_REMOTE}/{Config.GIT_BRANCH}'
+            changes = session.change_set(last_deployed, target)
 
-                return 'requirements.txt' in changed_files
+            if changes['commits']:
+                return {
+                    'new_commits': True,
+                    'commit_hash': changes['commits'][0],  # Most recent commit
+                    'commit_count': len(changes['commits']),
+                    'commits': changes['commits'],
+                    'changed_files': changes['changed_files'],
+                    'requirements_changed': changes['requirements_changed']
+                }
             else:
-                raise Exception(f"Git diff failed: {result.stderr}")
+                return {
+                    'new_commits': False,
+                    'message': 'No new commits detected'
+                }
 
         except Exception as e:
-            raise Exception(f"Failed to check requirements changes: {str(e)}")
+            raise Exception(f"Failed to check for new commits: {str(e)}")
 
     @staticmethod
     def run_watch_cycle():
         """Run complete watch cycle for new commits."""
-        try:
-            result = GitWatcher.check_for_new_commits()
+        with GitSession() as session:
+            try:
+                last_deployed = GitWatcher.get_last_deployed_commit(session)
+                result = GitWatcher.check_for_new_commits(session, last_deployed)
 
-            if result.get('new_commits', False):
-                # Check if requirements changed
-                requirements_changed = GitWatcher.check_requirements_changed()
-
-                return {
-                    'trigger_deployment': True,
-                    'commit_hash': result['commit_hash'],
-                    'commit_count': result['commit_count'],
-                    'requirements_changed': requirements_changed
-                }
-            else:
-                return {
-                    'trigger_deployment': False,
-                    'message': result.get('message', 'No changes detected')
-                }
+                if result.get('new_commits', False):
+                    return {
+                        'trigger_deployment': True,
+                        'commit_hash': result['commit_hash'],
+                        'commit_count': result['commit_count'],
+                        'previous_commit': last_deployed,
+                        'commits': result['commits'],
+                        'changed_files': result['changed_files'],
+                        'requirements_changed': result['requirements_changed'],
+                        'git_timings': session.timings
+                    }
+                else:
+                    return {
+                        'trigger_deployment': False,
+                        'message': result.get('message', 'No changes detected'),
+                        'git_timings': session.timings
+                    }
 
-        except Exception as e:
-            raise Exception(f"Watch cycle failed: {str(e)}")
+            except Exception as e:
+                raise Exception(f"Watch cycle failed: {str(e)}")
+            finally:
+                total = sum(t['duration'] for t in session.timings)
+                logging.info(f"Git watch cycle ran {len(session.timings)} git calls in {total:.2f}s")
@@ -3,10 +3,200 @@ Server Angel Health Checks Module
 Monitors system resources and service statuses.
 """
 
-import subprocess
+import os
+import threading
+import time
+from collections import deque
 import psutil
 from datetime import datetime, timedelta
 from config import Config
+from systemd_units import SystemdUnits
+
+
+class CpuSampler:
+    """Background sampler keeping a rolling window of CPU and load readings."""
+
+    def __init__(self, interval=None, window=None):
+        self.interval = interval or Config.CPU_SAMPLE_INTERVAL
+        self.window = window or Config.CPU_SAMPLE_WINDOW
+        # Invalid (non-positive) settings are reported by Config.validate(); don't fail at import
+        self.samples = deque(maxlen=max(1, int(self.window / self.interval)) if self.interval > 0 else 1)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling in a daemon thread."""
+        if self.running:
+            return
+        self._stop_event.clear()
+        # Prime psutil's counters so the first interval=None reading is meaningful
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+        self._thread = threading.Thread(target=self._run, name='cpu-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._record(psutil.cpu_percent(interval=None),
+                         psutil.cpu_percent(interval=None, percpu=True))
+
+    def _record(self, total, per_core):
+        try:
+            load = os.getloadavg()
+        except (AttributeError, OSError):
+            load = (0.0, 0.0, 0.0)
+
+        with self._lock:
+            self.samples.append({
+                'time': time.time(),
+                'total': total,
+                'per_core': per_core,
+                'load': load
+            })
+
+    def snapshot(self):
+        """Return the latest window summary without blocking.
+
+        Falls back to a single blocking sample when the sampler has not
+        collected anything yet (e.g. one-shot health-check runs).
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        if not samples:
+            per_core = psutil.cpu_percent(interval=self.interval, percpu=True)
+            total = sum(per_core) / len(per_core) if per_core else 0.0
+            self._record(total, per_core)
+            with self._lock:
+                samples = list(self.samples)
+
+        latest = samples[-1]
+        return {
+            'total': latest['total'],
+            'average': sum(s['total'] for s in samples) / len(samples),
+            'peak': max(s['total'] for s in samples),
+            'per_core': latest['per_core'],
+            'load_average': latest['load'],
+            'sample_count': len(samples),
+            'window_seconds': latest['time'] - samples[0]['time']
+        }
+
+
+# Shared sampler; started by daemon mode, used lazily by one-shot runs
+CPU_SAMPLER = CpuSampler()
+
+
+class HealthCache:
+    """Shared measurements with a TTL per collector.
+
+    Reports, deploy verification, the metrics exporter and the metric history
+    all read through this cache, so checks that run close together reuse one
+    measurement instead of each querying psutil and systemd again. Unit
+    statuses are cached per unit: a batch query only asks systemd for the
+    units that are missing or stale, and the deployer stores what its
+    readiness gate observed and drops the entries of units it restarts.
+    A TTL of 0 disables caching for that collector.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, key, ttl, now):
+        entry = self._entries.get(key)
+        if entry and now - entry[0] < ttl:
+            return entry
+        return None
+
+    def get(self, key, ttl, compute):
+        """Return the cached value for `key`, calling `compute()` once it is older than `ttl`."""
+        if ttl <= 0:
+            return compute()
+
+        entry = self._fresh(key, ttl, time.time())
+        if entry:
+            return entry[1]
+
+        # One caller recomputes; concurrent callers wait and reuse its result
+        with self._key_lock(key):
+            entry = self._fresh(key, ttl, time.time())
+            if entry:
+                return entry[1]
+            value = compute()
+            self.put(key, value)
+            return value
+
+    def put(self, key, value):
+        """Store a measurement taken elsewhere."""
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or everything when called without arguments."""
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def unit_statuses(self, units, ttl=None):
+        """Return {unit: status dict}, querying systemd only for stale units (in one call)."""
+        ttl = Config.HEALTH_CACHE_SERVICES_TTL if ttl is None else ttl
+        units = list(dict.fromkeys(u for u in units if u))
+
+        def cached():
+            now = time.time()
+            found = {}
+            for unit in units:
+                entry = self._fresh(f"unit:{unit}", ttl, now) if ttl > 0 else None
+                if entry:
+                    found[unit] = entry[1]
+            return found
+
+        statuses = cached()
+        if len(statuses) < len(units):
+            with self._key_lock('units'):
+                statuses = cached()
+                stale = [u for u in units if u not in statuses]
+                if stale:
+                    fresh = SystemdUnits.query_units(stale)
+                    self.put_units(fresh)
+                    statuses.update(fresh)
+
+        return {unit: dict(statuses[unit]) for unit in units}
+
+    def put_units(self, statuses):
+        """Store unit statuses; failed queries (timeouts, errors) are not cached."""
+        now = time.time()
+        with self._lock:
+            for unit, status in statuses.items():
+                if status.get('status') not in ('TIMEOUT', 'ERROR'):
+                    self._entries[f"unit:{unit}"] = (now, status)
+
+    def invalidate_units(self, units):
+        """Forget the statuses of units whose state just changed (e.g. after a restart)."""
+        self.invalidate(*(f"unit:{unit}" for unit in units))
+
+
+# Shared by health reports, deploy verification and the metrics exporter
+HEALTH_CACHE = HealthCache()
 
 
 class HealthChecker:
@@ -16,15 +206,15 @@ class HealthChecker:
     def get_system_health():
         """Get system resource usage."""
         try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU usage from the rolling sampler window
+            cpu = CPU_SAMPLER.snapshot()
+            cpu_percent = cpu['total']
 
-            # Memory usage
-            memory = psutil.virtual_memory()
+            # Memory and disk usage, reused while younger than their TTLs
+            memory = HEALTH_CACHE.get('memory', Config.HEALTH_CACHE_MEMORY_TTL, psutil.virtual_memory)
             memory_percent = memory.percent
 
-            # Disk usage
-            disk = psutil.disk_usage('/')
+            disk = HEALTH_CACHE.get('disk', Config.HEALTH_CACHE_DISK_TTL, lambda: psutil.disk_usage('/'))
             disk_percent = disk.percent
 
             def format_bytes(bytes_value):
@@ -41,9 +231,19 @@ class HealthChecker:
 
             return {
                 'cpu_usage': f"{cpu_percent:.1f}%",
+                'cpu_average': f"{cpu['average']:.1f}%",
+                'load_average': ', '.join(f"{value:.2f}" for value in cpu['load_average']),
                 'memory_usage': f"{memory_percent:.1f}% ({format_bytes(memory.used)} / {format_bytes(memory.total)})",
                 'disk_usage': f"{disk_percent:.1f}% ({format_bytes(disk.used)} / {format_bytes(disk.total)})",
                 'uptime': str(uptime).split('.')[0],  # Remove microseconds
+                'metrics': {
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory_percent,
+                    'disk_percent': disk_percent,
+                    'load_1': cpu['load_average'][0],
+                    'load_5': cpu['load_average'][1],
+                    'load_15': cpu['load_average'][2]
+                },
                 'status': 'OK'
             }
         except Exception as e:
@@ -55,44 +255,28 @@ class HealthChecker:
     @staticmethod
     def get_service_status(service_name):
         """Check systemd service status."""
-        try:
-            result = subprocess.run(
-                ['systemctl', 'is-active', service_name],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            status = result.stdout.strip()
-
-            if status == 'active':
-                return {'name': service_name, 'status': 'RUNNING', 'details': 'Active'}
-            elif status == 'inactive':
-                return {'name': service_name, 'status': 'STOPPED', 'details': 'Inactive'}
-            elif status == 'failed':
-                return {'name': service_name, 'status': 'FAILED', 'details': 'Failed'}
-            else:
-                return {'name': service_name, 'status': 'UNKNOWN', 'details': status}
-
-        except subprocess.TimeoutExpired:
-            return {'name': service_name, 'status': 'TIMEOUT', 'details': 'Check timed out'}
-        except Exception as e:
-            return {'name': service_name, 'status': 'ERROR', 'details': str(e)}
+        return HEALTH_CACHE.unit_statuses([service_name])[service_name]
 
     @staticmethod
     def check_all_services():
-        """Check status of all configured services."""
-        services = [
+        """Check status of all configured and discovered services with at most one systemctl call."""
+        legacy = [
             Config.NGINX_SERVICE,
             Config.GUNICORN_SERVICE,
             Config.REDIS_SERVICE,
             Config.CELERY_SERVICE
         ]
 
-        results = []
-        for service in services:
-            if service and not service.startswith('<'):  # Skip if placeholder
-                results.append(HealthChecker.get_service_status(service))
-            else:
+        units, unmatched, discovery_failed = SystemdUnits.resolve(Config.monitored_unit_patterns())
+        statuses = HEALTH_CACHE.unit_statuses(units)
+
+        results = [statuses[unit] for unit in units]
+        for pattern in unmatched:
+            results.append({'name': pattern, 'status': 'NOT_FOUND', 'details': 'No units matched'})
+        for pattern in discovery_failed:
+            results.append({'name': pattern, 'status': 'ERROR', 'details': 'Unit discovery failed'})
+        for service in legacy:
+            if not Config.is_configured(service):
                 results.append({
                     'name': service or 'Unknown Service',
                     'status': 'NOT_CONFIGURED',
@@ -102,10 +286,43 @@ class HealthChecker:
         return results
 
     @staticmethod
-    def run_full_health_check():
-        """Run complete health check."""
-        return {
+    def run_full_health_check(collectors=None):
+        """Run complete health check.
+
+        The HEALTH_COLLECTORS collectors (see collectors.py) run concurrently,
+        so the check takes at most as long as the slowest collector's timeout.
+        'system' and 'services' keep their usual shape; every other collector
+        lands in 'checks', and 'collectors' has each one's status and latency.
+        A failed or timed-out system collector is also listed in 'checks' so
+        reports count it as failing instead of showing empty metrics.
+        """
+        from collectors import COLLECTORS
+
+        started = time.time()
+        results = COLLECTORS.run(collectors or Config.split_list(Config.HEALTH_COLLECTORS))
+
+        health = {
             'timestamp': datetime.now().isoformat(),
-            'system': HealthChecker.get_system_health(),
-            'services': HealthChecker.check_all_services()
+            'system': {},
+            'services': [],
+            'checks': {},
+            'collectors': {
+                name: {'status': r['status'], 'latency': r['latency'], 'cached': r['cached']}
+                for name, r in results.items()
+            }
         }
+
+        for name, result in results.items():
+            failed = 'data' not in result
+            if name == 'system':
+                health['system'] = {'error': result['error'], 'status': result['status']} if failed else result['data']
+                if failed:
+                    health['checks'][name] = result
+            elif name == 'services':
+                health['services'] = [{'name': 'systemd', 'status': result['status'], 'details': result['error']}] \
+                    if failed else result['data']
+            elif result['status'] != 'NOT_CONFIGURED':
+                health['checks'][name] = result
+
+        health['duration'] = round(time.time() - started, 3)
+        return health
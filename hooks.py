@@ -0,0 +1,143 @@
+"""
+Server Angel Deploy Hooks Module
+Path-scoped deploy steps (migrations, static files, ...) run in a bounded worker pool.
+"""
+
+import json
+import logging
+import os
+import shlex
+import subprocess
+from pathlib import Path
+from config import Config
+from taskgraph import TaskGraph
+
+
+class DeployHooks:
+    """Loads hook declarations from DEPLOY_HOOKS_FILE and runs them.
+
+    Each hook is a JSON object:
+        name     - unique step name
+        command  - command string (split with shlex) or argument list
+        shell    - run the command through /bin/sh (default false)
+        paths    - globs; the hook only runs if a changed file matches (empty = always)
+        after    - names of hooks that must succeed first
+        stage    - 'pre_restart' (default) or 'post_restart'
+        timeout  - seconds (default 600)
+    """
+
+    STAGES = ('pre_restart', 'post_restart')
+
+    @staticmethod
+    def load(path=None):
+        """Read and validate hook declarations; returns [] when no file exists."""
+        path = Path(path or Config.DEPLOY_HOOKS_FILE)
+        if not path.exists():
+            return []
+
+        try:
+            with open(path, 'r') as f:
+                hooks = json.load(f)
+        except ValueError as e:
+            raise Exception(f"Invalid hooks file {path}: {str(e)}")
+
+        names = set()
+        for hook in hooks:
+            if not hook.get('name') or not hook.get('command'):
+                raise Exception(f"Hook entries need 'name' and 'command': {hook}")
+            if hook['name'] in names:
+                raise Exception(f"Duplicate hook name '{hook['name']}'")
+            if hook.get('stage', 'pre_restart') not in DeployHooks.STAGES:
+                raise Exception(f"Hook '{hook['name']}' has unknown stage '{hook.get('stage')}'")
+            names.add(hook['name'])
+
+        # Reject 'after' cycles now rather than when the stage runs
+        for stage in DeployHooks.STAGES:
+            graph = TaskGraph()
+            for hook in hooks:
+                if hook.get('stage', 'pre_restart') == stage:
+                    graph.add(hook['name'], None, after=hook.get('after', []))
+            try:
+                graph.check_cycles()
+            except ValueError as e:
+                raise Exception(f"Invalid hooks file {path}: {str(e)}")
+        return hooks
+
+    @staticmethod
+    def is_triggered(hook, changed_files):
+        """True if the hook has no path filter or any changed file matches one."""
+        patterns = hook.get('paths', [])
+        if not patterns or changed_files is None:
+            return True
+        return any(Config.path_matches(path, pattern) for path in changed_files for pattern in patterns)
+
+    @staticmethod
+    def _execute(hook, workdir, venv_path):
+        """Run a single hook command inside the project's virtualenv."""
+        env = dict(os.environ)
+        env['VIRTUAL_ENV'] = str(venv_path)
+        env['PATH'] = f"{Path(venv_path) / 'bin'}{os.pathsep}{env.get('PATH', '')}"
+
+        command = hook['command']
+        shell = hook.get('shell', False)
+        if isinstance(command, str) and not shell:
+            command = shlex.split(command)
+
+        result = subprocess.run(
+            command,
+            shell=shell,
+            cwd=str(workdir),
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=hook.get('timeout', 600)
+        )
+
+        output = (result.stdout + result.stderr).strip()[-1000:]
+        if result.returncode != 0:
+            return {'success': False, 'error': f"exit code {result.returncode}", 'output': output}
+        return {'success': True, 'output': output}
+
+    @staticmethod
+    def run(stage, changed_files, workdir, venv_path, hooks=None):
+        """Run the triggered hooks of one stage and return step dicts.
+
+        Steps use the same shape as deployment_log['steps'] entries:
+        {'step', 'status', 'duration', 'details'/'error'}.
+        """
+        hooks = [h for h in (DeployHooks.load() if hooks is None else hooks)
+                 if h.get('stage', 'pre_restart') == stage]
+        if not hooks:
+            return []
+
+        graph = TaskGraph()
+        skipped = {}
+        for hook in hooks:
+            if DeployHooks.is_triggered(hook, changed_files):
+                graph.add(
+                    hook['name'],
+                    lambda h=hook: DeployHooks._execute(h, workdir, venv_path),
+                    after=hook.get('after', [])
+                )
+            else:
+                skipped[hook['name']] = 'no matching paths changed'
+
+        outcomes = graph.run(max_workers=Config.HOOK_WORKERS) if graph.tasks else {}
+
+        steps = []
+        for hook in hooks:
+            name = hook['name']
+            step = {'step': f"hook_{name}"}
+            if name in skipped:
+                step.update({'status': 'skipped', 'duration': 0.0, 'details': {'reason': skipped[name]}})
+            else:
+                outcome = outcomes[name]
+                step['status'] = outcome['status']
+                step['duration'] = outcome['duration']
+                step['details'] = outcome['result'] or {}
+                if outcome['status'] != 'success':
+                    step['error'] = (outcome['result'] or {}).get('error') or outcome.get('error', 'failed')
+            logging.info(f"Hook {name}: {step['status']} ({step['duration']:.2f}s)")
+            steps.append(step)
+
+        return steps
@@ -0,0 +1,151 @@
+"""
+Server Angel HTTP Probe Module
+Readiness gate that polls local HTTP endpoints and systemd units until healthy.
+"""
+
+import http.client
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from config import Config
+from systemd_units import SystemdUnits
+
+
+class HttpProbe:
+    """Checks one URL, reusing a keep-alive connection between attempts."""
+
+    def __init__(self, url, timeout=None, expect_status=None):
+        self.url = url
+        self.timeout = Config.READINESS_REQUEST_TIMEOUT if timeout is None else timeout
+        self.expect_status = expect_status or Config.readiness_status_range()
+
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Invalid readiness URL '{url}'")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.headers = {
+            'Host': parts.netloc,
+            'Connection': 'keep-alive',
+            'User-Agent': 'server-angel-readiness'
+        }
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            self._conn = conn_class(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def check(self):
+        """Send one GET; returns {'ok', 'status', 'latency', 'error'?}."""
+        started = time.time()
+        try:
+            conn = self._connection()
+            conn.request('GET', self.path, headers=self.headers)
+            response = conn.getresponse()
+            response.read()
+            if response.will_close:
+                self.close()
+
+            low, high = self.expect_status
+            ok = low <= response.status <= high
+            result = {'ok': ok, 'status': response.status, 'latency': round(time.time() - started, 4)}
+            if not ok:
+                result['error'] = f"HTTP {response.status}"
+            return result
+
+        except (OSError, http.client.HTTPException) as e:
+            # Drop the connection; the next attempt reconnects
+            self.close()
+            return {'ok': False, 'status': None, 'latency': round(time.time() - started, 4),
+                    'error': str(e) or e.__class__.__name__}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ReadinessGate:
+    """Polls URLs and units concurrently with exponential backoff until all are
+    ready or the deadline passes.
+
+    Every target is polled in its own thread; a unit that enters the 'failed'
+    state stops the whole gate early instead of waiting for the deadline.
+    """
+
+    def __init__(self, urls=None, units=None, deadline=None, initial_delay=None, max_delay=None):
+        self.urls = Config.split_list(Config.READINESS_URLS) if urls is None else list(urls)
+        self.units = list(units or [])
+        self.deadline = Config.READINESS_TIMEOUT if deadline is None else deadline
+        self.initial_delay = Config.READINESS_INITIAL_DELAY if initial_delay is None else initial_delay
+        self.max_delay = Config.READINESS_MAX_DELAY if max_delay is None else max_delay
+        self._abort = threading.Event()
+
+    def _poll(self, check, started):
+        """Call check() until it reports ok, the deadline passes or the gate aborts."""
+        attempts = 0
+        delay = self.initial_delay
+        outcome = {}
+        while True:
+            attempts += 1
+            outcome = check()
+            elapsed = time.time() - started
+            if outcome.get('ok'):
+                return dict(outcome, ready=True, attempts=attempts, time_to_ready=round(elapsed, 3))
+            if outcome.get('fatal'):
+                self._abort.set()
+                break
+
+            remaining = self.deadline - elapsed
+            if remaining <= 0 or self._abort.wait(min(delay, remaining)):
+                break
+            delay = min(delay * 2, self.max_delay)
+
+        return dict(outcome, ready=False, attempts=attempts, time_to_ready=None)
+
+    def _check_units(self):
+        statuses = SystemdUnits.query_units(self.units)
+        not_ready = [u for u in self.units if statuses[u].get('active_state') != 'active']
+        failed = [u for u in self.units if statuses[u].get('active_state') == 'failed']
+        result = {'ok': not not_ready, 'statuses': statuses}
+        if failed:
+            result.update({'fatal': True, 'error': f"Failed: {', '.join(failed)}"})
+        elif not_ready:
+            result['error'] = f"Not active yet: {', '.join(not_ready)}"
+        return result
+
+    def wait(self):
+        """Run the gate and return per-target results plus overall time_to_ready."""
+        started = time.time()
+        probes = [HttpProbe(url) for url in self.urls]
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(probes) + 1) as pool:
+                unit_future = pool.submit(self._poll, self._check_units, started) if self.units else None
+                url_futures = [pool.submit(self._poll, probe.check, started) for probe in probes]
+
+                units = unit_future.result() if unit_future else {'ready': True, 'statuses': {}}
+                urls = {probe.url: future.result() for probe, future in zip(probes, url_futures)}
+        finally:
+            for probe in probes:
+                probe.close()
+
+        ready = units['ready'] and all(r['ready'] for r in urls.values())
+        result = {
+            'ready': ready,
+            'units': units,
+            'urls': urls,
+            'time_to_ready': round(time.time() - started, 3) if ready else None,
+            'elapsed': round(time.time() - started, 3)
+        }
+        logging.info(
+            f"Readiness gate {'passed' if ready else 'FAILED'} after {result['elapsed']:.2f}s "
+            f"({len(self.units)} units, {len(self.urls)} URLs)"
+        )
+        return result
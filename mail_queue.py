@@ -0,0 +1,210 @@
+"""
+Server Angel Mail Queue Module
+Disk-spooled outbound email delivered by a background worker with retries.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from config import Config
+
+
+class MailQueue:
+    """Outbound mail spool under MAIL_SPOOL_DIR.
+
+    Every message is one JSON file, written atomically, so nothing is lost if
+    the process dies or SMTP is down. Delivery happens in a background thread
+    (daemon mode) or in flush() at the end of a one-shot run. After a
+    temporary failure the whole queue backs off exponentially; permanently
+    rejected messages, and messages older than MAIL_MAX_AGE, are moved to
+    the 'failed' subdirectory instead of being deleted.
+    """
+
+    def __init__(self, spool_dir=None):
+        self.spool_dir = Path(spool_dir or Config.MAIL_SPOOL_DIR)
+        self.failed_dir = self.spool_dir / 'failed'
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._deliver_lock = threading.Lock()
+        self._thread = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Spool files
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _write(path, entry):
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def enqueue(self, subject, text_body, html_body=None, recipients=None):
+        """Spool a message for delivery and wake the worker."""
+        now = time.time()
+        entry = {
+            'subject': subject,
+            'text': text_body,
+            'html': html_body,
+            'recipients': list(recipients if recipients is not None else Config.EMAIL_RECIPIENTS),
+            'created': now,
+            'attempts': 0,
+            'last_error': None
+        }
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        # Time-prefixed names keep delivery in FIFO order
+        path = self.spool_dir / f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+        MailQueue._write(path, entry)
+        self._wakeup.set()
+        return path
+
+    def pending(self):
+        """Spooled message paths, oldest first."""
+        if not self.spool_dir.exists():
+            return []
+        return sorted(self.spool_dir.glob('*.json'))
+
+    def _fail(self, path, entry, reason):
+        """Move a message that will not be retried to the failed directory."""
+        entry['last_error'] = reason
+        self.failed_dir.mkdir(parents=True, exist_ok=True)
+        MailQueue._write(path, entry)
+        os.replace(path, self.failed_dir / path.name)
+        logging.error(f"Giving up on email '{entry.get('subject')}': {reason}")
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    def deliver(self, force=False, deadline=None):
+        """Send spooled messages until the spool is empty, SMTP fails or the deadline passes.
+
+        Returns {'sent', 'failed', 'remaining'}. Unless `force` is set,
+        nothing is attempted while the queue is backing off.
+        """
+        from mailer import EmailMailer, SMTP_SESSION
+
+        stats = {'sent': 0, 'failed': 0, 'remaining': 0}
+        if not force and time.time() < self._retry_at:
+            stats['remaining'] = len(self.pending())
+            return stats
+
+        with self._deliver_lock:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            # One deliverer per spool, also across processes (cron runs + daemon)
+            with open(self.spool_dir / '.lock', 'w') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    stats['remaining'] = len(self.pending())
+                    return stats
+
+                paths = self.pending()
+                for index, path in enumerate(paths):
+                    if self._stopped.is_set() and not force:
+                        break
+                    if deadline is not None and time.time() >= deadline:
+                        break
+
+                    try:
+                        with open(path, 'r') as f:
+                            entry = json.load(f)
+                    except FileNotFoundError:
+                        continue
+                    except ValueError as e:
+                        self._fail(path, {'subject': path.name}, f"Unreadable spool file: {str(e)}")
+                        stats['failed'] += 1
+                        continue
+
+                    if time.time() - entry['created'] > Config.MAIL_MAX_AGE:
+                        self._fail(path, entry, f"Not delivered within {Config.MAIL_MAX_AGE}s: "
+                                                f"{entry.get('last_error')}")
+                        stats['failed'] += 1
+                        continue
+
+                    msg = EmailMailer.build_message(
+                        entry['subject'], entry['text'], entry['html'], entry['recipients'],
+                        date=entry['created']
+                    )
+                    result = SMTP_SESSION.send(msg, entry['recipients'])
+
+                    if result['success']:
+                        path.unlink()
+                        stats['sent'] += 1
+                        self._failures = 0
+                        self._retry_at = 0.0
+                        continue
+
+                    entry['attempts'] += 1
+                    if not result.get('temporary'):
+                        self._fail(path, entry, result['error'])
+                        stats['failed'] += 1
+                        continue
+
+                    # SMTP is unavailable or misconfigured: keep the message and back off the whole queue
+                    entry['last_error'] = result['error']
+                    MailQueue._write(path, entry)
+                    self._failures += 1
+                    delay = min(Config.MAIL_RETRY_DELAY * 2 ** (self._failures - 1), Config.MAIL_RETRY_MAX_DELAY)
+                    self._retry_at = time.time() + delay
+                    logging.warning(f"Email delivery failed, {len(paths) - index} queued, "
+                                    f"retrying in {delay:.0f}s: {result['error']}")
+                    break
+
+                stats['remaining'] = len(self.pending())
+
+        if stats['sent'] or stats['failed']:
+            logging.info(f"Mail queue: {stats['sent']} sent, {stats['failed']} failed, "
+                         f"{stats['remaining']} remaining")
+        return stats
+
+    def flush(self, timeout=None):
+        """Try to deliver everything now, ignoring backoff (used by one-shot runs)."""
+        timeout = Config.MAIL_FLUSH_TIMEOUT if timeout is None else timeout
+        return self.deliver(force=True, deadline=time.time() + timeout)
+
+    # ------------------------------------------------------------------
+    # Background worker
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.deliver()
+            except Exception as e:
+                logging.error(f"Mail queue worker error: {str(e)}")
+
+            # Sleep until the backoff ends, or poll while another process holds the spool
+            wait = self._retry_at - time.time()
+            if wait <= 0:
+                wait = Config.MAIL_RETRY_DELAY if self.pending() else None
+            self._wakeup.wait(timeout=wait)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the delivery thread (daemon mode)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the delivery thread; spooled messages stay on disk."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=Config.SMTP_TIMEOUT + 5)
+        self._thread = None
+
+
+MAIL_QUEUE = MailQueue()
@@ -5,77 +5,227 @@ Handles SMTP email sending with proper error handling.
 
 import smtplib
 import logging
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import formatdate
 from config import Config
 
 
+class SmtpSession:
+    """A lazily opened SMTP connection reused across messages.
+
+    The connection is opened on the first send, checked with NOOP when it has
+    been idle for SMTP_NOOP_INTERVAL seconds, dropped after SMTP_MAX_IDLE
+    seconds of inactivity, and reopened once if the server disconnected.
+    """
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the connection, upgrade to TLS and log in."""
+        if Config.SMTP_PORT == 465:
+            # Use SSL
+            logging.info(f"Connecting to {Config.SMTP_HOST}:{Config.SMTP_PORT} with SSL")
+            server = smtplib.SMTP_SSL(Config.SMTP_HOST, Config.SMTP_PORT, timeout=Config.SMTP_TIMEOUT)
+        else:
+            # Use TLS (port 587 or others)
+            logging.info(f"Connecting to {Config.SMTP_HOST}:{Config.SMTP_PORT} with STARTTLS")
+            server = smtplib.SMTP(Config.SMTP_HOST, Config.SMTP_PORT, timeout=Config.SMTP_TIMEOUT)
+            server.starttls()  # Secure connection
+
+        try:
+            server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        logging.info("SMTP authentication successful")
+        self._server = server
+
+    def _drop(self):
+        """Close the connection without waiting on a dead server."""
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+            self._server = None
+
+    def _ensure_connected(self):
+        """Return a usable connection, probing or replacing a stale one."""
+        idle = time.time() - self._last_used
+        if self._server is not None and idle > Config.SMTP_MAX_IDLE:
+            self._quit()
+        elif self._server is not None and idle > Config.SMTP_NOOP_INTERVAL:
+            try:
+                if self._server.noop()[0] != 250:
+                    self._drop()
+            except (smtplib.SMTPException, OSError):
+                self._drop()
+
+        if self._server is None:
+            self._connect()
+        return self._server
+
+    def _quit(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    @staticmethod
+    def is_disconnect(e):
+        """True for errors that a fresh connection may fix (dropped link, 421)."""
+        if isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError)):
+            return True
+        return isinstance(e, smtplib.SMTPResponseException) and e.smtp_code == 421
+
+    @staticmethod
+    def is_temporary(e, connecting=False):
+        """True when a later retry of the same message may succeed.
+
+        Errors while connecting, starting TLS or logging in (`connecting`)
+        are session or configuration problems that affect every message, so
+        the queue keeps its messages. While sending, only a lost connection
+        or a 4xx reply is temporary; recipients refused with 4xx codes only.
+        Anything else (5xx replies, a mix of 4xx and 5xx refusals, or a
+        message smtplib cannot send such as a non-ASCII address raising
+        UnicodeEncodeError or SMTPNotSupportedError) is permanent for that
+        message and must not hold up the rest of the queue.
+        """
+        if connecting or isinstance(e, smtplib.SMTPServerDisconnected):
+            return True
+        # SMTPException subclasses OSError; plain OSErrors are socket failures
+        if isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException):
+            return True
+        if isinstance(e, smtplib.SMTPRecipientsRefused):
+            return bool(e.recipients) and all(400 <= code < 500 for code, _ in e.recipients.values())
+        if isinstance(e, smtplib.SMTPResponseException):
+            return 400 <= e.smtp_code < 500
+        return False
+
+    def send(self, msg, recipients):
+        """Send one message; reconnects once if the server went away."""
+        return self.send_batch([(msg, recipients)])[0]
+
+    def send_batch(self, messages):
+        """Send [(msg, recipients), ...] over one connection.
+
+        Returns one result per message ({'success', 'message'/'error'}); failed
+        results carry 'temporary' when a later retry may succeed. A reused
+        connection that turns out to be dead is replaced once; any other error
+        fails only the message it happened on.
+        """
+        results = []
+        with self._lock:
+            for msg, recipients in messages:
+                for attempt in (1, 2):
+                    reused = self._server is not None
+                    connecting = True
+                    try:
+                        server = self._ensure_connected()
+                        connecting = False
+                        server.sendmail(Config.EMAIL_FROM, recipients, msg.as_string())
+                        self._last_used = time.time()
+                        logging.info(f"Email sent to {len(recipients)} recipients")
+                        results.append({'success': True, 'message': f'Email sent to {len(recipients)} recipients'})
+                        break
+                    except Exception as e:
+                        if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                            self._drop()
+                        if attempt == 1 and reused and SmtpSession.is_disconnect(e):
+                            logging.info("SMTP connection lost, reconnecting")
+                            continue
+                        result = EmailMailer.describe_error(e)
+                        result['temporary'] = SmtpSession.is_temporary(e, connecting)
+                        results.append(result)
+                        break
+        return results
+
+    def close(self):
+        """Quit the session (safe to call when it was never opened)."""
+        with self._lock:
+            self._quit()
+
+
+SMTP_SESSION = SmtpSession()
+
+
 class EmailMailer:
     """Handles email sending via SMTP."""
 
     @staticmethod
-    def send_email(subject, text_body, html_body=None, recipients=None):
-        """Send email with subject, text body, and optional HTML body."""
+    def build_message(subject, text_body, html_body=None, recipients=None, date=None):
+        """Build the MIME message for a report; `date` is the creation timestamp."""
         if recipients is None:
             recipients = Config.EMAIL_RECIPIENTS
 
-        try:
-            # Create message container - 'alternative' ensures clients choose the best display option
-            msg = MIMEMultipart('alternative')
-            msg['From'] = Config.EMAIL_FROM
-            msg['To'] = ', '.join(recipients)
-            msg['Subject'] = subject
-
-            # Attach parts
-            # The order matters: text/plain first, then text/html
-            msg.attach(MIMEText(text_body, 'plain'))
-            
-            if html_body:
-                msg.attach(MIMEText(html_body, 'html'))
-
-            # Create SMTP connection based on port
-            if Config.SMTP_PORT == 465:
-                # Use SSL
-                logging.info(f"Connecting to {Config.SMTP_HOST}:{Config.SMTP_PORT} with SSL")
-                server = smtplib.SMTP_SSL(Config.SMTP_HOST, Config.SMTP_PORT)
-            else:
-                # Use TLS (port 587 or others)
-                logging.info(f"Connecting to {Config.SMTP_HOST}:{Config.SMTP_PORT} with STARTTLS")
-                server = smtplib.SMTP(Config.SMTP_HOST, Config.SMTP_PORT)
-                server.starttls()  # Secure connection
-
-            # Login
-            server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
-            logging.info("SMTP authentication successful")
+        # Create message container - 'alternative' ensures clients choose the best display option
+        msg = MIMEMultipart('alternative')
+        msg['From'] = Config.EMAIL_FROM
+        msg['To'] = ', '.join(recipients)
+        msg['Subject'] = subject
+        msg['Date'] = formatdate(date, localtime=True)
 
-            # Send email
-            server.sendmail(Config.EMAIL_FROM, recipients, msg.as_string())
-            logging.info(f"Email sent to {len(recipients)} recipients")
+        # Attach parts
+        # The order matters: text/plain first, then text/html
+        msg.attach(MIMEText(text_body, 'plain'))
 
-            # Close connection
-            server.quit()
+        if html_body:
+            msg.attach(MIMEText(html_body, 'html'))
 
-            return {'success': True, 'message': f'Email sent to {len(recipients)} recipients'}
+        return msg
 
-        except smtplib.SMTPAuthenticationError as e:
+    @staticmethod
+    def describe_error(e):
+        """Turn an SMTP exception into a logged {'success': False, 'error'} result."""
+        if isinstance(e, smtplib.SMTPAuthenticationError):
             error_msg = f"SMTP Authentication failed: {str(e)}"
-            logging.error(error_msg)
-            return {'success': False, 'error': error_msg}
-
-        except smtplib.SMTPConnectError as e:
+        elif isinstance(e, smtplib.SMTPConnectError):
             error_msg = f"SMTP Connection failed: {str(e)}"
-            logging.error(error_msg)
-            return {'success': False, 'error': error_msg}
-
-        except smtplib.SMTPException as e:
+        elif isinstance(e, smtplib.SMTPException):
             error_msg = f"SMTP error: {str(e)}"
-            logging.error(error_msg)
-            return {'success': False, 'error': error_msg}
+        else:
+            error_msg = f"Unexpected error sending email: {str(e)}"
+        logging.error(error_msg)
+        return {'success': False, 'error': error_msg}
+
+    @staticmethod
+    def send_email(subject, text_body, html_body=None, recipients=None):
+        """Send email with subject, text body, and optional HTML body.
+
+        With MAIL_QUEUE_ENABLED the message is spooled to disk and delivered
+        in the background; the call returns as soon as it is queued.
+        """
+        if Config.MAIL_QUEUE_ENABLED:
+            from mail_queue import MAIL_QUEUE
+            try:
+                MAIL_QUEUE.enqueue(subject, text_body, html_body, recipients)
+                return {'success': True, 'queued': True, 'message': 'Email queued for delivery'}
+            except Exception as e:
+                logging.error(f"Failed to spool email, sending directly: {str(e)}")
+
+        return EmailMailer.send_batch([(subject, text_body, html_body)], recipients)[0]
+
+    @staticmethod
+    def send_batch(messages, recipients=None):
+        """Send several (subject, text_body, html_body) emails over one SMTP connection."""
+        if recipients is None:
+            recipients = Config.EMAIL_RECIPIENTS
 
+        try:
+            built = [(EmailMailer.build_message(subject, text, html, recipients), recipients)
+                     for subject, text, html in messages]
         except Exception as e:
-            error_msg = f"Unexpected error sending email: {str(e)}"
-            logging.error(error_msg)
-            return {'success': False, 'error': error_msg}
+            return [EmailMailer.describe_error(e)] * len(messages)
+
+        return SMTP_SESSION.send_batch(built)
 
     @staticmethod
     def send_health_report(health_data, report_type="daily"):
@@ -94,11 +244,27 @@ class EmailMailer:
         return EmailMailer.send_email(subject, text, html)
 
     @staticmethod
-    def send_error_alert(error_message, context="general"):
+    def send_error_alert(error_message, context="general", occurrences=None):
         """Send error alert email."""
         from reporter import EmailReporter
 
-        subject, text, html = EmailReporter.build_error_report(error_message, context)
+        subject, text, html = EmailReporter.build_error_report(error_message, context, occurrences)
+        return EmailMailer.send_email(subject, text, html)
+
+    @staticmethod
+    def send_alert_resolved(context, alerts):
+        """Send the notice that a context's alerts have cleared."""
+        from reporter import EmailReporter
+
+        subject, text, html = EmailReporter.build_resolved_report(context, alerts)
+        return EmailMailer.send_email(subject, text, html)
+
+    @staticmethod
+    def send_alert_digest(alerts):
+        """Send the summary of suppressed alerts."""
+        from reporter import EmailReporter
+
+        subject, text, html = EmailReporter.build_alert_digest(alerts)
         return EmailMailer.send_email(subject, text, html)
 
     @staticmethod
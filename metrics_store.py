@@ -0,0 +1,261 @@
+"""
+Server Angel Metrics Store Module
+Fixed-size, memory-mapped ring buffer of raw health samples under STATE_DIR.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from config import Config
+
+
+class MetricHistory:
+    """Array-backed ring buffer of numeric health samples.
+
+    File layout: a 32-byte header followed by `capacity` fixed-size records.
+    Each record holds a timestamp, the system metrics in FIELDS, running/total
+    service counts and one state byte per unit slot. Unit names are mapped to
+    slots in a small JSON sidecar file.
+    """
+
+    MAGIC = b'SAMH'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHIIQ8x')  # magic, version, unit slots, capacity, record size, writes
+    FIELDS = ['cpu_percent', 'memory_percent', 'disk_percent', 'load_1', 'load_5', 'load_15']
+    MAX_UNITS = 64
+
+    # Per-unit state codes stored in each record
+    STATE_CODES = {'RUNNING': 1, 'OK': 1, 'STOPPED': 2, 'FAILED': 3}
+    STATE_OTHER = 4
+
+    def __init__(self, path=None, capacity=None):
+        self.path = path or Config.METRICS_HISTORY_FILE
+        self.capacity = capacity or Config.METRICS_HISTORY_CAPACITY
+        self.units_path = self.path.with_suffix('.units.json')
+        self.record = struct.Struct(f"<d{len(self.FIELDS)}f2H{self.MAX_UNITS}s")
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._units = {}
+
+    # ==========================
+    # FILE MANAGEMENT
+    # ==========================
+    def open(self):
+        """Open (creating or resizing if needed) the backing file."""
+        if self._map is not None:
+            return self
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        size = self.HEADER.size + self.capacity * self.record.size
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            header = self._file.read(self.HEADER.size)
+            valid = False
+            if len(header) == self.HEADER.size:
+                magic, version, slots, capacity, record_size, _ = self.HEADER.unpack(header)
+                valid = (magic == self.MAGIC and version == self.VERSION and slots == self.MAX_UNITS
+                         and capacity == self.capacity and record_size == self.record.size)
+
+            if not valid:
+                if header:
+                    logging.warning(f"Metric history layout changed, resetting {self.path}")
+                self._file.truncate(0)
+                self._file.truncate(size)
+                self._file.seek(0)
+                self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.MAX_UNITS,
+                                                  self.capacity, self.record.size, 0))
+                self._file.flush()
+                if self.units_path.exists():
+                    self.units_path.unlink()
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._load_units()
+        return self
+
+    def close(self):
+        """Flush and release the memory map."""
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+
+    def _load_units(self):
+        try:
+            with open(self.units_path, 'r') as f:
+                self._units = json.load(f)
+        except (OSError, ValueError):
+            self._units = {}
+
+    def _unit_slot(self, name):
+        """Return the slot for a unit, assigning a new one if there is room."""
+        if name not in self._units:
+            self._load_units()  # another process may have assigned slots
+        if name not in self._units:
+            if len(self._units) >= self.MAX_UNITS:
+                return None
+            self._units[name] = len(self._units)
+            tmp_path = self.units_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self._units, f)
+            os.replace(tmp_path, self.units_path)
+        return self._units[name]
+
+    @property
+    def write_count(self):
+        return self.HEADER.unpack_from(self._map, 0)[5]
+
+    def __len__(self):
+        self.open()
+        return min(self.write_count, self.capacity)
+
+    # ==========================
+    # WRITING
+    # ==========================
+    def append(self, timestamp, values, services=None):
+        """Append one sample in O(1), overwriting the oldest when full.
+
+        `values` maps names in FIELDS to numbers; `services` maps unit
+        names to status strings as produced by the health checker.
+        """
+        self.open()
+        services = services or {}
+
+        states = bytearray(self.MAX_UNITS)
+        running = 0
+        for name, status in services.items():
+            if status in ('RUNNING', 'OK'):
+                running += 1
+            slot = self._unit_slot(name)
+            if slot is not None:
+                states[slot] = self.STATE_CODES.get(status, self.STATE_OTHER)
+
+        row = [float(values.get(field) or 0.0) for field in self.FIELDS]
+
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                writes = self.write_count
+                offset = self.HEADER.size + (writes % self.capacity) * self.record.size
+                self.record.pack_into(self._map, offset, timestamp, *row,
+                                      running, len(services), bytes(states))
+                struct.pack_into('<Q', self._map, self.HEADER.size - 16, writes + 1)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def record_health(self, health_data):
+        """Append the raw numbers from a HealthChecker.run_full_health_check() result.
+
+        Results without system metrics (the system check failed or timed out)
+        are skipped rather than stored as zeros that would skew the trends.
+        """
+        metrics = health_data.get('system', {}).get('metrics', {})
+        if not metrics:
+            logging.warning("Health result has no system metrics, not recording a sample")
+            return
+        services = {
+            s.get('name'): s.get('status')
+            for s in health_data.get('services', [])
+            if s.get('status') != 'NOT_CONFIGURED'
+        }
+        self.append(time.time(), metrics, services)
+
+    # ==========================
+    # QUERIES
+    # ==========================
+    def _timestamp_at(self, index, count, writes):
+        """Timestamp of the index-th oldest record."""
+        position = (writes - count + index) % self.capacity
+        return struct.unpack_from('<d', self._map, self.HEADER.size + position * self.record.size)[0]
+
+    def _bisect(self, timestamp, count, writes):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp_at(mid, count, writes) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, start=None, end=None):
+        """Return samples with start <= timestamp < end as columns.
+
+        The range is located by binary search and decoded in at most two
+        contiguous slices with struct.iter_unpack, so cost is proportional to
+        the number of samples returned rather than the buffer size.
+        """
+        self.open()
+        with self._lock:
+            writes = self.write_count
+            count = min(writes, self.capacity)
+            first = self._bisect(start, count, writes) if start is not None else 0
+            last = self._bisect(end, count, writes) if end is not None else count
+
+            chunks = []
+            begin = (writes - count + first) % self.capacity
+            remaining = max(0, last - first)
+            while remaining:
+                length = min(remaining, self.capacity - begin)
+                offset = self.HEADER.size + begin * self.record.size
+                chunks.append(self._map[offset:offset + length * self.record.size])
+                remaining -= length
+                begin = 0
+
+        columns = {'timestamp': [], 'services_running': [], 'services_total': [], 'unit_states': []}
+        for field in self.FIELDS:
+            columns[field] = []
+
+        for chunk in chunks:
+            for row in self.record.iter_unpack(chunk):
+                columns['timestamp'].append(row[0])
+                for i, field in enumerate(self.FIELDS, start=1):
+                    columns[field].append(row[i])
+                columns['services_running'].append(row[-3])
+                columns['services_total'].append(row[-2])
+                columns['unit_states'].append(row[-1])
+
+        return columns
+
+    def unit_history(self, name, start=None, end=None):
+        """Return (timestamps, status codes) for a single unit."""
+        self.open()
+        slot = self._units.get(name)
+        columns = self.query(start, end)
+        if slot is None:
+            return columns['timestamp'], []
+        return columns['timestamp'], [states[slot] for states in columns['unit_states']]
+
+    def summary(self, since=None):
+        """Min/avg/max/last for every metric field since a timestamp."""
+        columns = self.query(start=since)
+        count = len(columns['timestamp'])
+        if not count:
+            return {'samples': 0}
+
+        result = {'samples': count, 'since': columns['timestamp'][0]}
+        for field in self.FIELDS + ['services_running']:
+            values = columns[field]
+            result[field] = {
+                'min': min(values),
+                'avg': sum(values) / count,
+                'max': max(values),
+                'last': values[-1]
+            }
+        return result
+
+
+# Shared history; opened lazily on first use
+METRIC_HISTORY = MetricHistory()
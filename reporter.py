@@ -4,6 +4,7 @@ Builds email content for health reports and deployment notifications.
 """
 
 from datetime import datetime
+from html import escape
 import socket
 from config import Config
 
@@ -79,6 +80,91 @@ class EmailReporter:
     </html>
     """
 
+    # Static page shell, prepared once per process by _page()
+    _hostname = None
+    _shell = None
+
+    @classmethod
+    def hostname(cls):
+        """Hostname of this server, looked up once."""
+        if cls._hostname is None:
+            cls._hostname = socket.gethostname()
+        return cls._hostname
+
+    @classmethod
+    def _page(cls, title, subtitle, content):
+        """Wrap HTML content in the page shell.
+
+        HTML_TEMPLATE (with its stylesheet and the hostname) is formatted once
+        with marker placeholders and split into static chunks, so each page
+        is a single join instead of a full format() of the template.
+        Arguments are inserted as-is and must already be escaped.
+        """
+        if cls._shell is None:
+            cls._shell = cls.HTML_TEMPLATE.format(
+                title='\x00title\x00',
+                subtitle='\x00subtitle\x00',
+                content='\x00content\x00',
+                hostname=escape(cls.hostname())
+            ).split('\x00')
+
+        values = {'title': title, 'subtitle': subtitle, 'content': content}
+        # Odd chunks are placeholder names, even chunks static markup
+        return ''.join(values[chunk] if i % 2 else chunk for i, chunk in enumerate(cls._shell))
+
+    @staticmethod
+    def _row(*cells):
+        """A service-list table row; cells are HTML and the first is the name column."""
+        first, rest = cells[0], cells[1:]
+        return ''.join(
+            ['<tr><td class="service-name">', first, '</td>'] +
+            [f'<td>{cell}</td>' for cell in rest] +
+            ['</tr>']
+        )
+
+    @staticmethod
+    def _ascii(markup):
+        """Replace non-ASCII characters (emoji) with character references.
+
+        Keeping the page ASCII lets CPython store it at one byte per character
+        instead of four, which shrinks every intermediate string and join.
+        """
+        return markup if markup.isascii() else markup.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+    @staticmethod
+    def _section(title, inner, title_style=''):
+        """A titled report section."""
+        style = f' style="{title_style}"' if title_style else ''
+        return f'<div class="section"><div class="section-title"{style}>{EmailReporter._ascii(title)}</div>{inner}</div>'
+
+    # Rendered status badges, keyed by (badge class, label)
+    _badges = {}
+
+    @staticmethod
+    def _badge(badge_class, label):
+        """Status badge HTML; the handful of distinct status badges are rendered once.
+
+        Only for labels from a fixed set (statuses); labels built from data,
+        such as counts, go through _plain_badge so the cache stays bounded.
+        """
+        key = (badge_class, label)
+        badge = EmailReporter._badges.get(key)
+        if badge is None:
+            badge = EmailReporter._badges[key] = EmailReporter._plain_badge(badge_class, label)
+        return badge
+
+    @staticmethod
+    def _plain_badge(badge_class, label):
+        """Badge HTML rendered on every call."""
+        return f'<span class="badge {badge_class}">{escape(str(label))}</span>'
+
+    @staticmethod
+    def _escape_all(values):
+        """HTML-escape many strings with one html.escape() call (a per-item call dominates large reports)."""
+        if not values:
+            return []
+        return escape('\x00'.join(values)).split('\x00')
+
     @staticmethod
     def _get_progress_color(percentage):
         """Return color based on usage percentage."""
@@ -94,130 +180,153 @@ class EmailReporter:
     def build_health_report(health_data, report_type="daily"):
         """Build health check email report (Text + HTML)."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        hostname = socket.gethostname()
+        hostname = EmailReporter.hostname()
         title = f"Health Report: {report_type.title()}"
         
         # --- Plain Text Generation (Legacy) ---
         subject = f"🛡️ {report_type.title()} Health - {hostname}"
-        
-        text_body = f"🛡️ SERVER ANGEL - {report_type.upper()} HEALTH REPORT\n{'=' * 50}\n\n"
-        text_body += f"Server: {hostname}\nTime: {timestamp}\n\n"
-        
-        # --- HTML Content Generation ---
-        html_content = ""
-        
+
+        text = [
+            f"🛡️ SERVER ANGEL - {report_type.upper()} HEALTH REPORT\n{'=' * 50}\n\n",
+            f"Server: {hostname}\nTime: {timestamp}\n\n"
+        ]
+        html = []
+
         # 1. System Status
         system = health_data.get('system', {})
-        html_content += '<div class="section"><div class="section-title">🖥️ System Status</div><div class="stats-grid">'
-        
+        # Without a measurement show N/A rather than a green 0% bar; the failure is listed under Checks
+        missing = 'N/A' if 'error' in system else '0%'
         metrics = [
-            ('CPU Usage', system.get('cpu_usage', '0%')),
-            ('Memory', system.get('memory_usage', '0%')),
-            ('Disk', system.get('disk_usage', '0%')),
+            ('CPU Usage', system.get('cpu_usage', missing)),
+            ('Load Average', system.get('load_average', 'N/A')),
+            ('Memory', system.get('memory_usage', missing)),
+            ('Disk', system.get('disk_usage', missing)),
             ('Uptime', system.get('uptime', 'N/A'))
         ]
-        
+
+        stats = []
         for label, value in metrics:
-            text_body += f"{label}: {value}\n"
-            
+            text.append(f"{label}: {value}\n")
+
             # HTML Progress Bar for percentage values
             progress_html = ""
             if '%' in value:
                 color = EmailReporter._get_progress_color(value)
-                width = value.strip('%')
+                width = escape(value.strip('%'))
                 progress_html = f'<div class="progress-container"><div class="progress-bar" style="width: {width}%; background-color: {color};"></div></div>'
-            
-            html_content += f"""
-            <div class="stat-item">
-                <span class="stat-label">{label}</span>
-                <span class="stat-value">{value}</span>
-                {progress_html}
-            </div>
-            """
-        html_content += '</div></div>'
-        text_body += "\n"
+
+            stats.append(
+                f'<div class="stat-item"><span class="stat-label">{label}</span>'
+                f'<span class="stat-value">{escape(value)}</span>{progress_html}</div>'
+            )
+        html.append(EmailReporter._section('🖥️ System Status', f'<div class="stats-grid">{"".join(stats)}</div>'))
+        text.append("\n")
 
         # 2. Services Status
-        text_body += f"🔧 SERVICES STATUS\n{'-' * 20}\n"
-        html_content += '<div class="section"><div class="section-title">🔧 Services Status</div><table class="service-list">'
-        
-        services = health_data.get('services', [])
+        text.append(f"🔧 SERVICES STATUS\n{'-' * 20}\n")
+
+        services = [svc for svc in health_data.get('services', []) if svc.get('status', 'UNKNOWN') != 'NOT_CONFIGURED']
+        names = [svc.get('name', 'Unknown') for svc in services]
+        total_count = len(services)
         running_count = 0
-        total_count = 0
-        
-        for service in services:
-            name = service.get('name', 'Unknown')
+        rows = []
+        badge = EmailReporter._badge
+        for service, name, html_name in zip(services, names, EmailReporter._escape_all(names)):
             status = service.get('status', 'UNKNOWN')
-            details = service.get('details', '')
-            
-            if status == 'NOT_CONFIGURED':
-                continue
-                
-            total_count += 1
-            
+            ok = status in ('RUNNING', 'OK')
+            if ok:
+                running_count += 1
+
             # Text Version
-            icon = "✅" if status in ['RUNNING', 'OK'] else "❌"
-            text_body += f"{icon} {name}: {status}\n"
-            
+            text.append(f"{'✅' if ok else '❌'} {name}: {status}\n")
+
             # HTML Version
-            badge_class = "bg-success" if status in ['RUNNING', 'OK'] else "bg-danger"
+            badge_class = "bg-success" if ok else "bg-danger"
             if status == 'UNKNOWN': badge_class = "bg-warning"
-            
-            html_content += f"""
-            <tr>
-                <td class="service-name">{name}</td>
-                <td><span class="badge {badge_class}">{status}</span></td>
-            </tr>
-            """
-            
-            if status in ['RUNNING', 'OK']:
-                running_count += 1
+            rows.append(f'<tr><td class="service-name">{html_name}</td><td>{badge(badge_class, status)}</td></tr>')
 
-        html_content += '</table></div>'
-        
-        # 3. Summary
-        text_body += f"\n📊 SUMMARY\n{'-' * 10}\n"
+        html.append(EmailReporter._section('🔧 Services Status', f'<table class="service-list">{"".join(rows)}</table>'))
+
+        # 3. Other collectors (disks, database, redis, http, logs)
+        checks = health_data.get('checks', {})
+        failing_checks = 0
+        if checks:
+            text.append(f"\n🩺 CHECKS\n{'-' * 20}\n")
+            rows = []
+            details = [str(check.get('data', {}).get('details') or check.get('error', '')) for check in checks.values()]
+            for (name, check), detail, html_detail in zip(checks.items(), details, EmailReporter._escape_all(details)):
+                status = check['status']
+                if status in ('ERROR', 'TIMEOUT'):
+                    failing_checks += 1
+                icon = '✅' if status == 'OK' else '⚠️' if status == 'WARNING' else '❌'
+                cached = ', cached' if check.get('cached') else ''
+                text.append(f"{icon} {name}: {status} - {detail} ({check['latency'] * 1000:.0f}ms{cached})\n")
+
+                badge_class = {'OK': 'bg-success', 'WARNING': 'bg-warning'}.get(status, 'bg-danger')
+                rows.append(EmailReporter._row(
+                    name, badge(badge_class, status), EmailReporter._ascii(html_detail),
+                    f"{check['latency'] * 1000:.0f} ms{cached}"
+                ))
+            if 'duration' in health_data:
+                text.append(f"Collected in {health_data['duration']:.2f}s\n")
+            html.append(EmailReporter._section('🩺 Checks', f'<table class="service-list">{"".join(rows)}</table>'))
+
+        # 4. Trends from metric history
+        trends = health_data.get('trends', {})
+        if trends.get('samples', 0) > 1:
+            text.append(f"\n📈 24H TRENDS ({trends['samples']} samples)\n{'-' * 20}\n")
+            rows = []
+            for label, field in [('CPU', 'cpu_percent'), ('Memory', 'memory_percent'), ('Disk', 'disk_percent')]:
+                trend = trends[field]
+                line = f"avg {trend['avg']:.1f}% / peak {trend['max']:.1f}%"
+                text.append(f"{label}: {line}\n")
+                rows.append(EmailReporter._row(label, line))
+            html.append(EmailReporter._section('📈 24h Trends', f'<table class="service-list">{"".join(rows)}</table>'))
+
+        # 5. Summary
+        text.append(f"\n📊 SUMMARY\n{'-' * 10}\n")
         status_msg = f"All systems operational ({running_count}/{total_count} running)"
         if running_count < total_count:
             status_msg = f"⚠️ Issues detected: {total_count - running_count} services down"
-            
-        text_body += status_msg + "\n"
-        
-        summary_color = "#27ae60" if running_count == total_count else "#e74c3c"
-        html_content += f"""
-        <div class="section" style="text-align: center; color: {summary_color}; font-weight: bold;">
-            {status_msg}
-        </div>
-        """
+        if failing_checks:
+            status_msg += f"; {failing_checks} checks failing" if running_count < total_count \
+                else f" - ⚠️ {failing_checks} checks failing"
+        text.append(status_msg + "\n")
+
+        healthy = running_count == total_count and not failing_checks
+        summary_color = "#27ae60" if healthy else "#e74c3c"
+        html.append(
+            f'<div class="section" style="text-align: center; color: {summary_color}; font-weight: bold;">'
+            f'{EmailReporter._ascii(status_msg)}</div>'
+        )
 
         # Final HTML Assembly
-        full_html = EmailReporter.HTML_TEMPLATE.format(
-            title=title,
-            subtitle=f"{timestamp} &bull; {hostname}",
-            content=html_content,
-            hostname=hostname
+        full_html = EmailReporter._page(
+            escape(title),
+            f"{timestamp} &bull; {escape(hostname)}",
+            ''.join(html)
         )
 
-        return subject, text_body, full_html
+        return subject, ''.join(text), full_html
 
     @staticmethod
     def build_deployment_report(deployment_data):
         """Build deployment report (Text + HTML)."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        hostname = socket.gethostname()
-        
+        hostname = EmailReporter.hostname()
+
         success = deployment_data.get('success', False)
-        commit = deployment_data.get('commit_hash', 'Unknown')[:8]
-        
+        commit = escape(deployment_data.get('commit_hash', 'Unknown')[:8])
+
         status_text = "SUCCESS" if success else "FAILED"
         subject = f"{'🚀' if success else '❌'} Deploy {status_text} - {commit} - {hostname}"
-        
+
         # --- Plain Text ---
-        text_body = f"DEPLOYMENT REPORT\nStatus: {status_text}\nCommit: {commit}\n\n"
-        
+        text = [f"DEPLOYMENT REPORT\nStatus: {status_text}\nCommit: {commit}\n\n"]
+
         # --- HTML Content ---
         color = "#27ae60" if success else "#e74c3c"
-        html_content = f"""
+        html = [f"""
         <div class="section" style="text-align: center;">
             <div style="font-size: 24px; font-weight: bold; color: {color}; margin-bottom: 10px;">
                 DEPLOYMENT {status_text}
@@ -225,75 +334,167 @@ class EmailReporter:
             <div style="background: #f8f9fa; padding: 10px; border-radius: 4px; font-family: monospace;">
                 Commit: {commit}
             </div>
-        </div>
-        <div class="section"><div class="section-title">📋 Deployment Steps</div><table class="service-list">
-        """
-        
+        </div>"""]
+
         steps = deployment_data.get('steps', [])
-        for step in steps:
-            name = step.get('step', '').replace('_', ' ').title()
+        names = [step.get('step', '').replace('_', ' ').title() for step in steps]
+        rows = []
+        badge = EmailReporter._badge
+        for step, name, html_name in zip(steps, names, EmailReporter._escape_all(names)):
             step_status = step.get('status', 'UNKNOWN').upper()
-            
+            duration = f" ({step['duration']:.1f}s)" if 'duration' in step else ""
+
             # Text
-            text_body += f"{name}: {step_status}\n"
-            
+            text.append(f"{name}: {step_status}{duration}\n")
+
             # HTML
             badge_class = "bg-success" if step_status == 'SUCCESS' else "bg-danger"
-            html_content += f"""
-            <tr>
-                <td class="service-name">{name}</td>
-                <td><span class="badge {badge_class}">{step_status}</span></td>
-            </tr>
-            """
-            
-        html_content += "</table></div>"
-        
+            if step_status == 'SKIPPED': badge_class = "bg-info"
+            rows.append(f'<tr><td class="service-name">{html_name}</td>'
+                        f'<td>{badge(badge_class, step_status)}{duration}</td></tr>')
+
+        html.append(EmailReporter._section('📋 Deployment Steps', f'<table class="service-list">{"".join(rows)}</table>'))
+
+        if deployment_data.get('time_to_ready') is not None:
+            ready_in = deployment_data['time_to_ready']
+            text.append(f"\nTime to ready: {ready_in:.1f}s\n")
+            html.append(EmailReporter._section('⏱️ Readiness', f'<p>Application ready {ready_in:.1f}s after restart</p>'))
+
+        benchmark = deployment_data.get('benchmark')
+        if benchmark and benchmark.get('results'):
+            baseline_note = f" (baseline {benchmark['baseline_commit'][:8]})" if benchmark.get('baseline_commit') else ""
+            text.append(f"\nLATENCY BENCHMARK{baseline_note}\n")
+
+            rows = [EmailReporter._row('Endpoint', 'p50 / p95 / p99 (ms)', 'Throughput', 'Baseline p95')]
+            for url, r in benchmark['results'].items():
+                base_p95 = benchmark.get('baseline', {}).get(url, {}).get('p95')
+                base_text = f"{base_p95}ms" if base_p95 is not None else "-"
+                text.append(f"{url}: p50 {r['p50']}ms, p95 {r['p95']}ms, p99 {r['p99']}ms, "
+                            f"{r['throughput']} req/s, {r['errors']} errors (baseline p95 {base_text})\n")
+                rows.append(EmailReporter._row(
+                    escape(url), f"{r['p50']} / {r['p95']} / {r['p99']}", f"{r['throughput']} req/s", base_text
+                ))
+
+            inner = [f'<table class="service-list">{"".join(rows)}</table>']
+            for message in benchmark.get('regressions', []):
+                text.append(f"REGRESSION: {message}\n")
+                inner.append(f'<p>{EmailReporter._badge("bg-danger", "REGRESSION")} {escape(message)}</p>')
+            html.append(EmailReporter._section('🏁 Latency Benchmark', ''.join(inner)))
+
+        rollback = deployment_data.get('rollback')
+        if rollback:
+            rb_ok = rollback.get('success', False)
+            rb_status = "SUCCESS" if rb_ok else "FAILED"
+            target = str(rollback.get('target', 'unknown'))
+            rb_duration = rollback.get('duration', 0)
+            text.append(f"\nROLLBACK: {rb_status} in {rb_duration:.1f}s -> {target}\n")
+            if rollback.get('error'):
+                text.append(f"Rollback error: {rollback['error']}\n")
+            html.append(EmailReporter._section(
+                '↩️ Automatic Rollback',
+                f'<p>{EmailReporter._badge("bg-success" if rb_ok else "bg-danger", rb_status)} '
+                f'restored <code>{escape(target)}</code> in {rb_duration:.1f}s</p>'
+            ))
+
         if 'error' in deployment_data:
             err = deployment_data['error']
-            text_body += f"\nERROR: {err}\n"
-            html_content += f"""
-            <div class="section">
-                <div class="section-title" style="color: #e74c3c;">❌ Error Details</div>
-                <div style="background: #fff5f5; color: #c0392b; padding: 10px; border-radius: 4px; font-size: 13px;">
-                    {err}
-                </div>
-            </div>
-            """
+            text.append(f"\nERROR: {err}\n")
+            html.append(EmailReporter._section(
+                '❌ Error Details',
+                '<div style="background: #fff5f5; color: #c0392b; padding: 10px; border-radius: 4px; font-size: 13px;">'
+                f'{escape(str(err))}</div>',
+                title_style='color: #e74c3c;'
+            ))
 
-        full_html = EmailReporter.HTML_TEMPLATE.format(
-            title="Deployment Notification",
-            subtitle=f"{timestamp} &bull; {commit}",
-            content=html_content,
-            hostname=hostname
+        full_html = EmailReporter._page(
+            "Deployment Notification",
+            f"{timestamp} &bull; {commit}",
+            ''.join(html)
         )
-        
-        return subject, text_body, full_html
+
+        return subject, ''.join(text), full_html
 
     @staticmethod
-    def build_error_report(error_message, context="general"):
-        """Build error alert (Text + HTML)."""
+    def build_error_report(error_message, context="general", occurrences=None):
+        """Build error alert (Text + HTML).
+
+        `occurrences` ({'count', 'first_seen'}) marks a reminder for an error
+        that has kept recurring.
+        """
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        hostname = socket.gethostname()
+        hostname = EmailReporter.hostname()
         subject = f"🚨 Error Alert - {context} - {hostname}"
-        
+
         text_body = f"ERROR ALERT\nContext: {context}\n\n{error_message}"
-        
-        html_content = f"""
-        <div class="section">
-            <div class="section-title" style="color: #e74c3c;">🚨 Error Alert</div>
-            <p><strong>Context:</strong> {context}</p>
-            <div style="background: #fff5f5; color: #c0392b; padding: 15px; border-radius: 4px; font-family: monospace; font-size: 13px;">
-                {error_message}
-            </div>
-        </div>
-        """
-        
-        full_html = EmailReporter.HTML_TEMPLATE.format(
-            title="System Alert",
-            subtitle=f"{timestamp}",
-            content=html_content,
-            hostname=hostname
+
+        repeat_html = ""
+        if occurrences:
+            since = datetime.fromtimestamp(occurrences['first_seen']).strftime("%Y-%m-%d %H:%M")
+            subject = f"🚨 Still failing - {context} - {hostname}"
+            text_body += f"\n\nSeen {occurrences['count']} times since {since}"
+            repeat_html = f"<p>Seen <strong>{occurrences['count']}</strong> times since {since}</p>"
+
+        html_content = EmailReporter._section(
+            '🚨 Error Alert',
+            f'<p><strong>Context:</strong> {escape(context)}</p>'
+            '<div style="background: #fff5f5; color: #c0392b; padding: 15px; border-radius: 4px; font-family: monospace; font-size: 13px;">'
+            f'{escape(str(error_message))}</div>{repeat_html}',
+            title_style='color: #e74c3c;'
         )
-        
+
+        full_html = EmailReporter._page("System Alert", timestamp, html_content)
+
         return subject, text_body, full_html
 
+    @staticmethod
+    def build_resolved_report(context, alerts):
+        """Build the 'resolved' notice for a context's cleared alerts (Text + HTML)."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        hostname = EmailReporter.hostname()
+        subject = f"✅ Resolved - {context} - {hostname}"
+
+        first_seen = min(a['first_seen'] for a in alerts)
+        duration = (datetime.now() - datetime.fromtimestamp(first_seen)).total_seconds() / 60
+        text = [f"RESOLVED\nContext: {context}\nFailing for {duration:.0f} minutes\n\n"]
+
+        rows = []
+        for alert in alerts:
+            text.append(f"- {alert['message']} ({alert['count']}x)\n")
+            rows.append(EmailReporter._row(escape(alert['message']), EmailReporter._plain_badge('bg-info', f"{alert['count']}x")))
+
+        html_content = EmailReporter._section(
+            '✅ Resolved',
+            f'<p><strong>Context:</strong> {escape(context)} &bull; failing for {duration:.0f} minutes</p>'
+            f'<table class="service-list">{"".join(rows)}</table>',
+            title_style='color: #27ae60;'
+        )
+
+        full_html = EmailReporter._page("Alert Resolved", timestamp, html_content)
+
+        return subject, ''.join(text), full_html
+
+    @staticmethod
+    def build_alert_digest(alerts):
+        """Build the digest of alerts that were suppressed since the last one (Text + HTML)."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        hostname = EmailReporter.hostname()
+        subject = f"📬 Alert Digest - {len(alerts)} open - {hostname}"
+
+        text = ["ALERT DIGEST\n\n"]
+        rows = []
+        for alert in alerts:
+            last_seen = datetime.fromtimestamp(alert['last_seen']).strftime("%Y-%m-%d %H:%M")
+            text.append(f"[{alert['context']}] {alert['message']}\n"
+                        f"  {alert['suppressed']} suppressed, {alert['count']} total, last seen {last_seen}\n")
+            rows.append(EmailReporter._row(
+                escape(alert['context']),
+                escape(alert['message']),
+                f"{EmailReporter._plain_badge('bg-warning', str(alert['suppressed']) + ' suppressed')}"
+                f"<br>{alert['count']} total, last {last_seen}"
+            ))
+
+        html_content = EmailReporter._section('📬 Open Alerts', f'<table class="service-list">{"".join(rows)}</table>')
+
+        full_html = EmailReporter._page("Alert Digest", timestamp, html_content)
+
+        return subject, ''.join(text), full_html
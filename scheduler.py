@@ -0,0 +1,152 @@
+"""
+Server Angel Scheduler Module
+Runs recurring jobs inside a single long-lived process (daemon mode).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Job:
+    """A named job that runs on a fixed interval or at daily wall-clock times."""
+
+    def __init__(self, name, func, interval=None, daily_times=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_times = daily_times or []
+        self.next_run = None
+        self.last_duration = None
+        # Pending out-of-schedule run requested via Scheduler.trigger()
+        self.trigger_at = None
+        self.trigger_deadline = None
+
+    def due(self):
+        """Timestamp at which the job should next run, including triggers."""
+        if self.trigger_at is not None:
+            return min(self.next_run, self.trigger_at)
+        return self.next_run
+
+    def schedule_next(self, now):
+        """Compute the next run timestamp after `now`."""
+        if self.interval:
+            self.next_run = now + self.interval
+            return
+
+        current = datetime.fromtimestamp(now)
+        candidates = []
+        for hour, minute in self.daily_times:
+            run_at = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if run_at <= current:
+                run_at += timedelta(days=1)
+            candidates.append(run_at.timestamp())
+        self.next_run = min(candidates)
+
+
+class Scheduler:
+    """Minimal in-process scheduler; jobs run one at a time on the caller's thread."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    @staticmethod
+    def parse_time(value):
+        """Parse an 'HH:MM' string into an (hour, minute) tuple."""
+        try:
+            hour, minute = value.strip().split(':')
+            hour, minute = int(hour), int(minute)
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError
+            return hour, minute
+        except ValueError:
+            raise ValueError(f"Invalid time '{value}', expected HH:MM")
+
+    def add_interval_job(self, name, func, interval, run_immediately=True):
+        """Register a job that runs every `interval` seconds."""
+        job = Job(name, func, interval=interval)
+        now = time.time()
+        job.next_run = now if run_immediately else now + interval
+        with self._condition:
+            self.jobs[name] = job
+            self._condition.notify()
+        return job
+
+    def add_daily_job(self, name, func, times):
+        """Register a job that runs every day at each 'HH:MM' in `times`."""
+        job = Job(name, func, daily_times=[Scheduler.parse_time(t) for t in times])
+        job.schedule_next(time.time())
+        with self._condition:
+            self.jobs[name] = job
+            self._condition.notify()
+        return job
+
+    def trigger(self, name, delay=0, max_delay=None):
+        """Request an early run of a job, coalescing bursts of requests.
+
+        Each call pushes the run back to `delay` seconds from now (debounce),
+        but never beyond `max_delay` seconds after the first pending request.
+        Requests made while the job is running schedule one more run after it.
+        """
+        now = time.time()
+        with self._condition:
+            job = self.jobs.get(name)
+            if job is None:
+                raise KeyError(f"Unknown job '{name}'")
+
+            if job.trigger_at is None:
+                job.trigger_deadline = now + (max_delay if max_delay is not None else delay)
+            job.trigger_at = min(now + delay, job.trigger_deadline)
+            self._condition.notify()
+
+    def stop(self):
+        """Ask the run loop to exit after the current job finishes."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _next_due_job(self):
+        """Block until a job is due or the scheduler is stopped."""
+        with self._condition:
+            while not self._stopped:
+                if not self.jobs:
+                    self._condition.wait()
+                    continue
+
+                job = min(self.jobs.values(), key=lambda j: j.due())
+                delay = job.due() - time.time()
+                if delay <= 0:
+                    job.trigger_at = None
+                    job.trigger_deadline = None
+                    return job
+                self._condition.wait(timeout=delay)
+            return None
+
+    def run(self):
+        """Run jobs until stop() is called."""
+        logging.info(f"Scheduler started with jobs: {', '.join(self.jobs) or 'none'}")
+
+        while True:
+            job = self._next_due_job()
+            if job is None:
+                break
+
+            started = time.time()
+            try:
+                job.func()
+            except Exception as e:
+                logging.error(f"Scheduled job '{job.name}' failed: {str(e)}")
+            finally:
+                job.last_duration = time.time() - started
+                with self._condition:
+                    job.schedule_next(time.time())
+
+            logging.info(
+                f"Job '{job.name}' finished in {job.last_duration:.2f}s, "
+                f"next run at {datetime.fromtimestamp(job.next_run).strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+
+        logging.info("Scheduler stopped")
@@ -0,0 +1,206 @@
+"""
+Server Angel Systemd Units Module
+Batched systemd status queries shared by the health checker and deployer.
+"""
+
+import fnmatch
+import logging
+import subprocess
+import threading
+import time
+from config import Config
+
+
+class SystemdUnits:
+    """Queries systemd for many units in a single `systemctl show` call."""
+
+    # Cache of resolved unit patterns: {tuple(patterns): (timestamp, units, unmatched)}
+    _discovery_cache = {}
+    _discovery_lock = threading.Lock()
+
+    PROPERTIES = ['LoadState', 'ActiveState', 'SubState', 'MainPID', 'NRestarts', 'ActiveEnterTimestamp']
+
+    STATUS_MAP = {
+        'active': ('RUNNING', 'Active'),
+        'reloading': ('RUNNING', 'Reloading'),
+        'inactive': ('STOPPED', 'Inactive'),
+        'deactivating': ('STOPPED', 'Deactivating'),
+        'failed': ('FAILED', 'Failed'),
+        'activating': ('UNKNOWN', 'Activating'),
+    }
+
+    @staticmethod
+    def _parse_blocks(output):
+        """Split `systemctl show` output into one property dict per unit."""
+        blocks = []
+        current = {}
+        for line in output.splitlines():
+            if not line.strip():
+                if current:
+                    blocks.append(current)
+                    current = {}
+                continue
+            key, _, value = line.partition('=')
+            current[key] = value
+        if current:
+            blocks.append(current)
+        return blocks
+
+    @staticmethod
+    def _build_status(name, props):
+        """Turn raw systemd properties into the status dict used across Server Angel."""
+        active_state = props.get('ActiveState', '')
+        sub_state = props.get('SubState', '')
+
+        if props.get('LoadState') == 'not-found':
+            status, details = 'NOT_FOUND', 'Unit not found'
+        else:
+            status, details = SystemdUnits.STATUS_MAP.get(active_state, ('UNKNOWN', active_state))
+            if sub_state:
+                details = f"{details} ({sub_state})"
+
+        try:
+            main_pid = int(props.get('MainPID') or 0)
+        except ValueError:
+            main_pid = 0
+        try:
+            restarts = int(props.get('NRestarts') or 0)
+        except ValueError:
+            restarts = 0
+
+        return {
+            'name': name,
+            'status': status,
+            'details': details,
+            'active_state': active_state,
+            'sub_state': sub_state,
+            'main_pid': main_pid,
+            'restarts': restarts,
+            'active_since': props.get('ActiveEnterTimestamp', '')
+        }
+
+    @staticmethod
+    def query_units(units, timeout=10):
+        """Return {unit: status dict} for all units using one systemctl call.
+
+        If the batched call fails (e.g. one invalid unit name makes systemctl
+        exit non-zero), each unit is queried on its own so one bad name only
+        affects its own status. Timeouts are not retried unit by unit.
+        """
+        units = list(dict.fromkeys(u for u in units if u))
+        if not units:
+            return {}
+
+        try:
+            result = subprocess.run(
+                ['systemctl', 'show', '-p', ','.join(SystemdUnits.PROPERTIES), '--'] + units,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+
+            blocks = SystemdUnits._parse_blocks(result.stdout)
+            if result.returncode != 0 or len(blocks) != len(units):
+                raise Exception(result.stderr.strip() or f"expected {len(units)} units, got {len(blocks)}")
+
+            return {name: SystemdUnits._build_status(name, props) for name, props in zip(units, blocks)}
+
+        except subprocess.TimeoutExpired:
+            return {name: {'name': name, 'status': 'TIMEOUT', 'details': 'Check timed out'} for name in units}
+        except Exception as e:
+            if len(units) > 1:
+                logging.warning(f"Batched systemctl show failed, querying units one by one: {str(e)}")
+                statuses = {}
+                for name in units:
+                    statuses.update(SystemdUnits.query_units([name], timeout=timeout))
+                return statuses
+            return {name: {'name': name, 'status': 'ERROR', 'details': str(e)} for name in units}
+
+    @staticmethod
+    def is_active(unit, timeout=10):
+        """Return True if the unit is currently active."""
+        status = SystemdUnits.query_units([unit], timeout=timeout).get(unit, {})
+        return status.get('active_state') == 'active'
+
+    @staticmethod
+    def is_pattern(name):
+        """Return True if a unit name contains glob characters."""
+        return any(ch in name for ch in '*?[')
+
+    @staticmethod
+    def list_units(patterns, timeout=10):
+        """List loaded service units matching the given glob patterns."""
+        result = subprocess.run(
+            ['systemctl', 'list-units', '--all', '--type=service', '--plain',
+             '--no-legend', '--no-pager', '--'] + list(patterns),
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        if result.returncode != 0:
+            raise Exception(f"systemctl list-units failed: {result.stderr.strip()}")
+
+        units = []
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if fields:
+                units.append(fields[0])
+        return sorted(set(units))
+
+    @staticmethod
+    def resolve(patterns, ttl=None):
+        """Expand unit names/patterns into concrete units.
+
+        Literal names are kept as-is; glob patterns are resolved with one
+        `systemctl list-units` call and the result is cached for `ttl`
+        seconds so repeated checks within a cycle do not re-query systemd.
+        Returns (units, unmatched_patterns, failed_patterns): unmatched
+        patterns matched nothing in a successful query, failed patterns could
+        not be resolved because `systemctl list-units` itself failed.
+        """
+        ttl = Config.UNIT_DISCOVERY_TTL if ttl is None else ttl
+        key = tuple(patterns)
+
+        with SystemdUnits._discovery_lock:
+            cached = SystemdUnits._discovery_cache.get(key)
+            if cached and time.time() - cached[0] < ttl:
+                return list(cached[1]), list(cached[2]), []
+
+        globs = [p for p in patterns if SystemdUnits.is_pattern(p)]
+        discovered = []
+        discovery_failed = False
+        if globs:
+            try:
+                discovered = SystemdUnits.list_units(globs)
+            except Exception as e:
+                discovery_failed = True
+                logging.error(f"Unit discovery failed for {', '.join(globs)}: {str(e)}")
+
+        units = []
+        unmatched = []
+        failed = []
+        for pattern in patterns:
+            if not SystemdUnits.is_pattern(pattern):
+                units.append(pattern)
+                continue
+            if discovery_failed:
+                failed.append(pattern)
+                continue
+            matches = [u for u in discovered if fnmatch.fnmatch(u, pattern)
+                       or fnmatch.fnmatch(u, f"{pattern}.service")]
+            if matches:
+                units.extend(matches)
+            else:
+                unmatched.append(pattern)
+
+        units = list(dict.fromkeys(units))
+        if not discovery_failed:
+            with SystemdUnits._discovery_lock:
+                SystemdUnits._discovery_cache[key] = (time.time(), units, unmatched)
+        return list(units), list(unmatched), failed
+
+    @staticmethod
+    def invalidate_discovery():
+        """Drop cached pattern resolutions (e.g. at the start of a new cycle)."""
+        with SystemdUnits._discovery_lock:
+            SystemdUnits._discovery_cache.clear()
@@ -0,0 +1,103 @@
+"""
+Server Angel Task Graph Module
+Runs named tasks concurrently while respecting declared dependencies.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TaskGraph:
+    """A small DAG executor: a task starts once everything it runs after has succeeded."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.dependencies = {}
+
+    def add(self, name, func, after=()):
+        """Register a task; `after` lists task names that must finish first."""
+        self.tasks[name] = func
+        self.dependencies[name] = list(after)
+
+    def check_cycles(self):
+        """Raise ValueError if the dependencies contain a cycle."""
+        visiting, done = set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dep in self.dependencies.get(name, []):
+                if dep in self.tasks:
+                    visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.tasks:
+            visit(name, [])
+
+    @staticmethod
+    def _succeeded(result):
+        return not isinstance(result, dict) or result.get('success', True)
+
+    def run(self, max_workers=4):
+        """Run all tasks and return {name: outcome} in registration order.
+
+        Each outcome has 'status' (success / failed / skipped), 'result',
+        'duration' and 'started' (seconds after the graph started). Tasks
+        whose dependencies failed or were skipped are skipped. Dependencies
+        on names that are not part of the graph are ignored.
+        """
+        self.check_cycles()
+
+        graph_start = time.time()
+        outcomes = {}
+        lock = threading.Lock()
+        pending = {
+            name: [d for d in deps if d in self.tasks and d != name]
+            for name, deps in self.dependencies.items()
+        }
+
+        def execute(name):
+            started = time.time()
+            try:
+                result = self.tasks[name]()
+                status = 'success' if TaskGraph._succeeded(result) else 'failed'
+                outcome = {'status': status, 'result': result}
+            except Exception as e:
+                logging.error(f"Task '{name}' failed: {str(e)}")
+                outcome = {'status': 'failed', 'result': None, 'error': str(e)}
+            outcome['started'] = round(started - graph_start, 3)
+            outcome['duration'] = round(time.time() - started, 3)
+            with lock:
+                outcomes[name] = outcome
+            return name
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            running = set()
+            while pending or running:
+                for name in list(pending):
+                    deps = pending[name]
+                    if any(outcomes.get(d, {}).get('status') in ('failed', 'skipped') for d in deps):
+                        failed = [d for d in deps if outcomes.get(d, {}).get('status') != 'success']
+                        outcomes[name] = {
+                            'status': 'skipped',
+                            'result': None,
+                            'error': f"Skipped: dependency {', '.join(failed)} did not succeed",
+                            'started': None,
+                            'duration': 0.0
+                        }
+                        del pending[name]
+                    elif all(outcomes.get(d, {}).get('status') == 'success' for d in deps):
+                        running.add(pool.submit(execute, name))
+                        del pending[name]
+
+                if running:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    running = set(running)
+
+        return {name: outcomes[name] for name in self.tasks}
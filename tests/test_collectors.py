@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from collectors import collect_database
+from config import Config
+
+
+class SqliteDatabaseCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (Config.DATABASE_URL, Config.PROJECT_ROOT)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'app.db')
+        open(self.db_path, 'w').close()
+
+    def tearDown(self):
+        Config.DATABASE_URL, Config.PROJECT_ROOT = self._saved
+        self.tmp.cleanup()
+
+    def test_four_slashes_is_absolute(self):
+        Config.DATABASE_URL = f'sqlite:///{self.db_path}'
+        result = collect_database()
+        self.assertEqual(result['status'], 'OK')
+        self.assertIn(self.db_path, result['details'])
+
+    def test_three_slashes_is_relative_to_project_root(self):
+        Config.PROJECT_ROOT = self.tmp.name
+        Config.DATABASE_URL = 'sqlite:///app.db'
+        result = collect_database()
+        self.assertEqual(result['status'], 'OK')
+        self.assertIn(self.db_path, result['details'])
+
+    def test_relative_path_is_not_read_from_filesystem_root(self):
+        Config.PROJECT_ROOT = self.tmp.name
+        Config.DATABASE_URL = 'sqlite:///missing.db'
+        self.assertEqual(collect_database()['status'], 'ERROR')
+
+
+if __name__ == '__main__':
+    unittest.main()
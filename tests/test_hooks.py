@@ -0,0 +1,53 @@
+import unittest
+
+from config import Config
+from deployer import Deployer
+from hooks import DeployHooks
+
+
+class PathMatchTest(unittest.TestCase):
+
+    def test_double_star_matches_top_level_paths(self):
+        self.assertTrue(Config.path_matches('migrations/0002.py', '**/migrations/**'))
+        self.assertTrue(Config.path_matches('static/app.css', '**/static/**'))
+        self.assertTrue(Config.path_matches('settings.py', '**/settings*.py'))
+
+    def test_double_star_matches_nested_paths(self):
+        self.assertTrue(Config.path_matches('shop/migrations/0002.py', '**/migrations/**'))
+        self.assertTrue(Config.path_matches('a/b/static/css/app.css', '**/static/**'))
+        self.assertTrue(Config.path_matches('a/x/b/c', 'a/**/b/**/c'))
+        self.assertTrue(Config.path_matches('a/b/c', 'a/**/b/**/c'))
+
+    def test_non_matching_paths(self):
+        self.assertFalse(Config.path_matches('shop/models.py', '**/migrations/**'))
+        self.assertFalse(Config.path_matches('mystatic/app.css', '**/static/**'))
+
+
+class HookTriggerTest(unittest.TestCase):
+
+    def test_hook_triggered_by_top_level_path(self):
+        hook = {'name': 'migrate', 'paths': ['**/migrations/**']}
+        self.assertTrue(DeployHooks.is_triggered(hook, ['migrations/0002.py']))
+        self.assertFalse(DeployHooks.is_triggered(hook, ['shop/views.py']))
+
+    def test_hook_without_paths_always_runs(self):
+        self.assertTrue(DeployHooks.is_triggered({'name': 'check'}, ['README.md']))
+
+
+class RestartPathRulesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = Config.RESTART_PATH_MAP
+        Config.RESTART_PATH_MAP = '**/static/**=nginx:reload;**/*.py=gunicorn'
+
+    def tearDown(self):
+        Config.RESTART_PATH_MAP = self._saved
+
+    def test_top_level_paths_use_path_rules(self):
+        plan = Deployer.plan_restarts(['static/app.css', 'settings.py'])
+        self.assertEqual(plan['units'], ['nginx', 'gunicorn'])
+        self.assertEqual(plan['strategies'], {'nginx': 'reload'})
+
+
+if __name__ == '__main__':
+    unittest.main()
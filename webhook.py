@@ -0,0 +1,124 @@
+"""
+Server Angel Webhook Module
+Local HTTP listener that turns verified push notifications into git watch runs.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Handles POSTed push payloads (GitHub, Gitea or GitLab style)."""
+
+    MAX_BODY = 1024 * 1024  # 1 MB
+
+    def log_message(self, format, *args):
+        logging.debug(f"Webhook {self.address_string()} - {format % args}")
+
+    def _respond(self, code, message):
+        body = json.dumps({'message': message}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        listener = self.server.listener
+
+        if self.path.split('?')[0] != listener.path:
+            return self._respond(404, 'Not found')
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return self._respond(400, 'Invalid Content-Length')
+        if length > self.MAX_BODY:
+            return self._respond(413, 'Payload too large')
+
+        body = self.rfile.read(length)
+
+        if not listener.verify(body, self.headers):
+            logging.warning(f"Rejected webhook from {self.address_string()}: bad signature")
+            return self._respond(401, 'Invalid signature')
+
+        event = self.headers.get('X-GitHub-Event') or self.headers.get('X-Gitea-Event') or ''
+        if event == 'ping':
+            return self._respond(200, 'pong')
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            return self._respond(400, 'Invalid JSON')
+
+        ref = payload.get('ref') if isinstance(payload, dict) else None
+        if ref and ref != f'refs/heads/{Config.GIT_BRANCH}':
+            return self._respond(202, f'Ignored push to {ref}')
+
+        listener.on_push(payload)
+        return self._respond(202, 'Deployment check scheduled')
+
+
+class WebhookListener:
+    """Runs the webhook HTTP server in a background thread."""
+
+    def __init__(self, on_push, host=None, port=None, secret=None, path=None):
+        self.on_push = on_push
+        self.host = host or Config.WEBHOOK_HOST
+        self.port = Config.WEBHOOK_PORT if port is None else port
+        self.secret = (secret if secret is not None else Config.WEBHOOK_SECRET).encode()
+        self.path = path or Config.WEBHOOK_PATH
+        self._server = None
+        self._thread = None
+
+    @staticmethod
+    def sign(body, secret):
+        """Return the X-Hub-Signature-256 header value for a payload."""
+        if isinstance(secret, str):
+            secret = secret.encode()
+        return 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+    def verify(self, body, headers):
+        """Check the HMAC signature (or GitLab token) against the shared secret."""
+        signature = headers.get('X-Hub-Signature-256') or headers.get('X-Gitea-Signature')
+        if signature:
+            if not signature.startswith('sha256='):
+                signature = 'sha256=' + signature
+            # Compare bytes: compare_digest rejects str with non-ASCII characters
+            return hmac.compare_digest(signature.encode(errors='replace'),
+                                       WebhookListener.sign(body, self.secret).encode())
+
+        token = headers.get('X-Gitlab-Token')
+        if token:
+            return hmac.compare_digest(token.encode(errors='replace'), self.secret)
+
+        return False
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        """Bind the listener and serve requests in a daemon thread."""
+        if not self.secret:
+            raise ValueError("WEBHOOK_SECRET must be set to enable the webhook listener")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), WebhookHandler)
+        self._server.daemon_threads = True
+        self._server.listener = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        logging.info(f"Webhook listener on http://{self.address[0]}:{self.address[1]}{self.path}")
+
+    def stop(self):
+        """Shut down the HTTP server."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self._server = None
+        self._thread = None